@@ -1,17 +1,31 @@
+import argparse
+import csv
+import os
+import sys
+import time
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from heapq import heapify, heappop, heapreplace
+from itertools import chain, islice
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from hashlib import blake2b
+from tempfile import TemporaryFile
+from zipfile import BadZipFile
+
 import numpy as np
 
 
 def hash_rows(ar):
-    row_ids = ar[:, 0].copy()
-    # Assuming the data has been discretized into fewer
-    # than 10000 bins and that `ar` has up to 3 columns,
-    # this should work.
-    # Alternatively generating steps like so might be safer:
-    # steps = ar[:, :-1].max(axis=0) + 1
-    # step_i = np.prod(steps[:i])
-    for i in range(1, ar.shape[1]):
-        row_ids += ar[:, i] * 10000 ** i
-    return row_ids
+    """
+    Map each row of ``ar`` to a unique integer id.
+
+    Columns are encoded separately and combined with exact mixed-radix
+    arithmetic, so ids cannot collide regardless of the number of bins.
+    """
+    columns, cardinalities = encode_columns(ar)
+    return joint_keys(columns.T, cardinalities + 1)
 
 
 def distribution(ar):
@@ -41,14 +55,320 @@ def entropy(ar):
     return -np.sum(p * np.log2(p))
 
 
+def code_dtype(n_codes):
+    """Return the smallest unsigned integer type able to hold ``n_codes``."""
+    return np.min_scalar_type(max(n_codes - 1, 0))
+
+
+def encode(ar):
+    """
+    Encode a column of discretized values as integers ``0 .. k - 1``.
+
+    Missing values are given the code ``k``, so every column gets one
+    extra slot which can be sliced off of the joint counts.
+    Returns the codes, stored in the smallest sufficient unsigned type,
+    and the cardinality ``k``.
+    """
+    nans = np.isnan(ar)
+    values = ar[~nans]
+    if values.size and values.min() >= 0 and np.all(values == np.floor(values)):
+        # discrete values are already indices, no need for sorting
+        n_values = int(values.max()) + 1
+        codes = np.where(nans, n_values, ar).astype(code_dtype(n_values + 1))
+    else:
+        uniques, inverse = np.unique(values, return_inverse=True)
+        n_values = len(uniques)
+        codes = np.full(ar.shape, n_values, dtype=code_dtype(n_values + 1))
+        codes[~nans] = inverse
+    return codes, n_values
+
+
+def encode_indices(ar, cardinalities):
+    """
+    Encode a 2d array of value indices into codes as by
+    :obj:`encode_columns`, but with known cardinalities of columns.
+
+    Returns `None` if any value is not a non-negative integer below the
+    cardinality of its column.
+    """
+    nans = np.isnan(ar)
+    values = np.where(nans, 0, ar)
+    if np.any(values < 0) or np.any(values >= cardinalities) \
+            or np.any(values != np.floor(values)):
+        return None
+    return np.where(nans, cardinalities, values).astype(np.int64)
+
+
+def combine_targets(columns, cardinalities):
+    """
+    Combine codes of targets into a single column of codes of the class.
+    A row is missing if any of its targets is missing.
+
+    Returns the codes and the cardinality of the combined class.
+    """
+    if columns.shape[1] == 1:
+        return columns[:, 0], int(cardinalities[0])
+    missing = np.any(columns == cardinalities, axis=1)
+    codes = joint_keys(columns.T, cardinalities)
+    cardinality = int(np.prod(cardinalities))
+    return np.where(missing, cardinality, codes) \
+        .astype(code_dtype(cardinality + 1)), cardinality
+
+
+def empty_codes(shape, dtype, on_disk=False):
+    """
+    Allocate a column-major code matrix, in memory or, if `on_disk`,
+    mapped to an anonymous temporary file that is removed once closed.
+    """
+    if not on_disk:
+        return np.empty(shape, dtype=dtype, order="F")
+    return np.memmap(TemporaryFile(), dtype=dtype, mode="w+",
+                     shape=shape, order="F")
+
+
+def encode_columns(ar, on_disk=False):
+    """
+    Encode each column of a 2d array with :obj:`encode`.
+
+    Returns a code matrix of a single compact type, wide enough for the
+    column with the most values, and the cardinality of each column.
+    The matrix is column-major, so that columns are contiguous; if
+    `on_disk`, it is memory-mapped (see :obj:`empty_codes`).
+    """
+    codes = empty_codes(ar.shape, np.uint8, on_disk)
+    cardinalities = np.empty(ar.shape[1], dtype=np.int64)
+    for i in range(ar.shape[1]):
+        column, cardinalities[i] = encode(ar[:, i])
+        if not np.can_cast(column.dtype, codes.dtype):
+            wider = empty_codes(ar.shape, column.dtype, on_disk)
+            for j in range(i):
+                wider[:, j] = codes[:, j]
+            codes = wider
+        codes[:, i] = column
+    return codes, cardinalities
+
+
+def joint_keys(columns, radices):
+    """
+    Combine encoded ``columns`` into exact int64 mixed-radix keys.
+
+    Raises ``ValueError`` if the number of possible value combinations
+    does not fit into int64.
+    """
+    if np.prod([int(radix) for radix in radices]) > np.iinfo(np.int64).max:
+        raise ValueError("Too many value combinations for int64 keys.")
+    keys = columns[0].astype(np.int64)
+    for column, radix in zip(columns[1:], radices[1:]):
+        keys *= radix
+        keys += column
+    return keys
+
+
+def joint_counts(columns, radices):
+    """
+    Count occurrences of value combinations in encoded ``columns``.
+
+    Rows are mapped to mixed-radix keys, so counting is a single
+    ``np.bincount`` instead of sorting. Returns an array of shape ``radices``.
+    """
+    radices = tuple(int(radix) for radix in radices)
+    keys = joint_keys(columns, radices)
+    return np.bincount(keys, minlength=int(np.prod(radices))).reshape(radices)
+
+
+if hasattr(np, "bitwise_count"):
+    popcount = np.bitwise_count
+else:  # numpy < 2.0
+    _BYTE_POPCOUNTS = np.array([bin(i).count("1") for i in range(256)],
+                               dtype=np.uint8)
+
+    def popcount(ar):
+        """Return the number of set bits in each element of `ar`."""
+        counts = _BYTE_POPCOUNTS[ar.view(np.uint8)]
+        return counts.reshape(ar.shape + (-1,)).sum(axis=-1)
+
+
+def pack_rows(mask):
+    """
+    Pack a 2d boolean array into bits of uint64 words along rows;
+    bits beyond the length of rows are zero.
+    """
+    packed = np.packbits(mask, axis=1, bitorder="little")
+    padding = -packed.shape[1] % 8
+    if padding:
+        packed = np.pad(packed, ((0, 0), (0, padding)))
+    return packed.view(np.uint64)
+
+
+def entropy_from_counts(counts):
+    counts = counts[counts > 0]
+    p = counts / counts.sum()
+    return -np.sum(p * np.log2(p))
+
+
+def segment_entropies(counts, starts):
+    """
+    Compute entropies of consecutive segments of a flat array of ``counts``.
+
+    Each segment begins at the corresponding index in ``starts``;
+    segments must not be empty. Uses ``H = log(N) - sum(c log c) / N``,
+    which only needs two ``np.add.reduceat`` passes.
+    """
+    if not len(counts):
+        return np.zeros(len(starts))
+    totals = np.add.reduceat(counts, starts).astype(float)
+    plogp = np.add.reduceat(counts * np.log2(np.maximum(counts, 1)), starts)
+    nonzero = totals > 0
+    entropies = np.zeros(len(starts))
+    entropies[nonzero] = np.log2(totals[nonzero]) \
+        - plogp[nonzero] / totals[nonzero]
+    return entropies
+
+
+class Measure:
+    """
+    Scores of pairs of attributes that `InteractionScorer.score_measures`
+    derives from the same joint counts of both attributes and the class.
+    """
+    INTERACTION, SYMMETRIC_UNCERTAINTY, CONDITIONAL_MI, CHI_SQUARE = 0, 1, 2, 3
+    name = {INTERACTION: "Interaction",
+            SYMMETRIC_UNCERTAINTY: "Symmetric Uncertainty",
+            CONDITIONAL_MI: "Conditional MI",
+            CHI_SQUARE: "Chi-square"}
+
+
 class InteractionScorer:
-    def __init__(self, data):
+    UNIQUE, BINCOUNT = 0, 1
+    # upper bound for the number of keys counted at once in `score_pairs`
+    MAX_KEYS = 1 << 22
+    # number of rows counted at once; bounds memory for long data
+    CHUNK_ROWS = 1 << 16
+    # upper bound for the number of cells of joint counts kept for `append`
+    MAX_KEPT_CELLS = 1 << 25
+    # combinations of attributes with at most this many values (and a class
+    # with at most this many) are counted on bit vectors, see `_count_packed`;
+    # on short data, counting codes is faster
+    MAX_PACKED_CARDINALITY = 3
+    MIN_PACKED_ROWS = 1 << 8
+
+    def __init__(self, data, backend=BINCOUNT, on_disk=False):
         self.data = data
+        self.backend = backend
+        self.on_disk = on_disk
+        self.n_rows = len(data.X)
         self.class_entropy = 0
         self.information_gain = np.zeros(data.X.shape[1])
+        self.entropies = np.zeros(data.X.shape[1])
+        self._init_state()
+
+        self.codes = self.cardinalities = None
+        self.class_codes = self.class_cardinality = None
+        self.target_codes = self.target_cardinalities = None
+        if backend == InteractionScorer.BINCOUNT:
+            self.encode()
 
         self.preprocess()
 
+    @classmethod
+    def from_codes(cls, codes, cardinalities, class_codes, class_cardinality,
+                   class_entropy=None, information_gain=None, entropies=None,
+                   target_codes=None, target_cardinalities=None):
+        """
+        Construct a scorer from already encoded data, e.g. a code matrix
+        in shared memory or a ``np.memmap`` of codes stored on disk.
+        Information gains and entropies of attributes are computed unless
+        given. Codes of separate targets default to the class.
+        """
+        scorer = cls.__new__(cls)
+        scorer.data = None
+        scorer.backend = InteractionScorer.BINCOUNT
+        scorer.on_disk = isinstance(codes, np.memmap)
+        scorer.n_rows = len(codes)
+        scorer.codes = codes
+        scorer.cardinalities = np.asarray(cardinalities)
+        scorer.class_codes = class_codes
+        scorer.class_cardinality = int(class_cardinality)
+        if target_codes is None:
+            target_codes = class_codes[:, None]
+            target_cardinalities = [class_cardinality]
+        scorer.target_codes = target_codes
+        scorer.target_cardinalities = np.asarray(target_cardinalities)
+        scorer._init_state()
+        if information_gain is None:
+            scorer.class_entropy = 0
+            scorer.information_gain = np.zeros(codes.shape[1])
+            scorer.entropies = np.zeros(codes.shape[1])
+            scorer.preprocess()
+        else:
+            scorer.class_entropy = class_entropy
+            scorer.information_gain = np.asarray(information_gain)
+            scorer.entropies = entropies
+        return scorer
+
+    def _init_state(self):
+        """
+        Set up state that does not depend on how the data are given:
+        caches derived from codes, counts of attributes and kept counts.
+        """
+        self.pair_cache = {}
+        self._fingerprint = None
+        self._bits = None
+        self._permutations = None
+        self._target_gains = None
+        self.class_counts = self.attr_counts = None
+        # joint counts of scored combinations, if `keep_counts` is set
+        self.keep_counts = False
+        self.counts = {}
+        self.n_kept_cells = 0
+
+    @classmethod
+    def from_arrays(cls, X, Y, on_disk=False):
+        """
+        Construct a scorer from arrays of discretized values of attributes
+        and of the class, without a data table.
+        """
+        codes, cardinalities = encode_columns(X, on_disk)
+        columns, target_cardinalities = \
+            encode_columns(Y.reshape(len(X), -1), on_disk)
+        return cls.from_codes(codes, cardinalities,
+                              *combine_targets(columns, target_cardinalities),
+                              target_codes=columns,
+                              target_cardinalities=target_cardinalities)
+
+    def subset(self, rows):
+        """
+        Return a scorer on a subset of `rows`; class entropy and information
+        gains are recomputed on the subset.
+        """
+        return InteractionScorer.from_codes(
+            np.asfortranarray(self.codes[rows]), self.cardinalities,
+            self.class_codes[rows], self.class_cardinality,
+            target_codes=self.target_codes[rows],
+            target_cardinalities=self.target_cardinalities)
+
+    def encode(self):
+        """
+        Encode all attributes and the class once, so that joint distributions
+        can be computed by counting instead of sorting.
+
+        If the scorer is `on_disk`, codes are written to a memory-mapped
+        temporary file instead of kept in memory.
+        Codes are stored in the smallest sufficient unsigned type, along with
+        the cardinality of each column; the missing value code of a column
+        equals its cardinality.
+        A multi-target class is combined into a single column of codes,
+        with a row missing if any of its targets is missing; codes of
+        targets are kept for `score_targets`.
+        """
+        self.codes, self.cardinalities = \
+            encode_columns(self.data.X, self.on_disk)
+
+        Y = self.data.Y.reshape(len(self.data.X), -1)
+        self.target_codes, self.target_cardinalities = \
+            encode_columns(Y, self.on_disk)
+        self.class_codes, self.class_cardinality = \
+            combine_targets(self.target_codes, self.target_cardinalities)
+
     def preprocess(self):
         """
         Precompute information gain of each attribute to speed up
@@ -61,13 +381,120 @@ class InteractionScorer:
         well as negative interactions with greater magnitude than the
         combined information gain.
         """
+        if self.backend == InteractionScorer.BINCOUNT:
+            self.class_counts = np.zeros(self.class_cardinality + 1,
+                                         dtype=np.int64)
+            self.attr_counts = [
+                np.zeros((card + 1, self.class_cardinality + 1), dtype=np.int64)
+                for card in self.cardinalities]
+            self._count_attributes(self.row_chunks())
+            return
+
         self.class_entropy = entropy(self.data.Y)
         for attr in range(self.information_gain.size):
+            self.entropies[attr] = entropy(self.data.X[:, attr])
             self.information_gain[attr] = self.class_entropy \
-                               + entropy(self.data.X[:, attr]) \
+                               + self.entropies[attr] \
                                - entropy(np.column_stack((self.data.X[:, attr], self.data.Y)))
 
+    def _count_attributes(self, row_chunks):
+        """
+        Add counts of the class and of each attribute with the class
+        in the given chunks of rows, and update entropies and information
+        gains.
+        """
+        for rows in row_chunks:
+            self.class_counts += np.bincount(self.class_codes[rows],
+                                             minlength=len(self.class_counts))
+            for attr, counts in enumerate(self.attr_counts):
+                counts += joint_counts((self.codes[rows, attr],
+                                        self.class_codes[rows]), counts.shape)
+        self.class_entropy = entropy_from_counts(self.class_counts[:-1])
+        for attr, counts in enumerate(self.attr_counts):
+            self.entropies[attr] = entropy_from_counts(counts[:-1].sum(axis=1))
+            self.information_gain[attr] = self.class_entropy \
+                + self.entropies[attr] \
+                - entropy_from_counts(counts[:-1, :-1])
+
+    def append(self, X, Y):
+        """
+        Add rows to the scored data.
+
+        Values must be indices of discrete values, as given by the same
+        discretization as the original data. Only the new rows are counted:
+        counts of the class, attributes and of combinations kept due to
+        `keep_counts` are updated, while other combinations are counted
+        anew once scored.
+
+        Returns `False` and leaves the scorer unchanged if the new rows
+        contain values that were not seen before; a new scorer is needed
+        in this case.
+        """
+        if self.backend != InteractionScorer.BINCOUNT:
+            return False
+        codes = encode_indices(X, self.cardinalities)
+        columns = encode_indices(Y.reshape(len(X), -1),
+                                 self.target_cardinalities)
+        if codes is None or columns is None:
+            return False
+        class_codes, _ = combine_targets(columns, self.target_cardinalities)
+        if self.class_counts is None:
+            # scorers constructed with given information gains have not
+            # counted values of attributes yet
+            self.class_entropy = 0
+            self.information_gain = np.zeros(len(self.cardinalities))
+            self.entropies = np.zeros(len(self.cardinalities))
+            self.preprocess()
+
+        n_old, self.n_rows = self.n_rows, self.n_rows + len(X)
+        all_codes = empty_codes((self.n_rows, len(self.cardinalities)),
+                                self.codes.dtype, self.on_disk)
+        for rows in self.row_chunks(stop=n_old):
+            all_codes[rows] = self.codes[rows]
+        all_codes[n_old:] = codes
+        self.codes = all_codes
+        self.class_codes = np.concatenate(
+            (self.class_codes, class_codes.astype(self.class_codes.dtype)))
+        self.target_codes = np.concatenate(
+            (self.target_codes, columns.astype(self.target_codes.dtype)))
+
+        new_rows = self.row_chunks(start=n_old)
+        self._count_attributes(new_rows)
+        self.pair_cache.clear()
+        self._fingerprint = None
+        self._bits = None
+        self._permutations = None
+        self._target_gains = None
+        kept = list(self.counts)
+        for m in {len(key) for key in kept}:
+            attrs = np.array([key for key in kept if len(key) == m])
+            for start in range(0, len(attrs), self.block_size):
+                block = attrs[start:start + self.block_size]
+                counts, starts, sizes = self._count_block(block, new_rows)
+                for key, first, size in zip(block.tolist(), starts, sizes):
+                    self.counts[tuple(key)] += counts[first:first + size]
+        return True
+
+    def fingerprint(self):
+        """
+        Return a digest of the encoded data, which identifies equal data,
+        e.g. for caching results.
+        """
+        if self._fingerprint is None:
+            digest = blake2b(digest_size=16)
+            digest.update(str(self.codes.dtype).encode())
+            digest.update(np.asarray(self.cardinalities, dtype=np.int64).tobytes())
+            digest.update(np.int64(self.class_cardinality).tobytes())
+            for rows in self.row_chunks():
+                digest.update(np.ascontiguousarray(self.codes[rows]).tobytes())
+                digest.update(np.ascontiguousarray(self.class_codes[rows]).tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
     def __call__(self, attr1, attr2):
+        if self.backend == InteractionScorer.BINCOUNT:
+            return self.score_pairs([(attr1, attr2)])[0]
+
         attrs = self.data.X[:, (attr1, attr2)]
         return self.class_entropy \
             - self.information_gain[attr1] \
@@ -75,5 +502,1444 @@ class InteractionScorer:
             + entropy(attrs) \
             - entropy(np.column_stack((attrs, self.data.Y)))
 
+    @property
+    def block_size(self):
+        """Number of pairs `score_pairs` can count in a single pass."""
+        return max(1, self.MAX_KEYS // max(min(self.n_rows, self.CHUNK_ROWS), 1))
+
+    def row_chunks(self, start=0, stop=None):
+        """
+        Return slices of at most `CHUNK_ROWS` rows. Counts are accumulated
+        over chunks, so memory does not grow with the number of rows,
+        and memory-mapped codes are read one chunk at a time.
+        """
+        stop = self.n_rows if stop is None else stop
+        return [slice(first, min(first + self.CHUNK_ROWS, stop))
+                for first in range(start, stop, self.CHUNK_ROWS)]
+
+    def score_pairs(self, pairs):
+        """
+        Compute interactions for an array of attribute pairs of shape (k, 2).
+
+        Joint counts of all pairs in a block share a single buffer:
+        each pair is given its own range of keys and the whole block is
+        counted with one ``np.bincount`` per chunk of rows. Blocks are
+        limited to `block_size` pairs to bound the memory used by keys.
+
+        Apart from bookkeeping over pairs, the work is done by NumPy
+        operations on whole columns (``take``, in-place arithmetic,
+        ``bincount``, ``add.reduceat``), which mostly run without the GIL,
+        so several threads can score pairs at once.
+        """
+        pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+        if self.backend != InteractionScorer.BINCOUNT:
+            return np.array([self(attr1, attr2) for attr1, attr2 in pairs])
+
+        joint, joint_class = self.joint_entropies(pairs)
+        return self.class_entropy \
+            - self.information_gain[pairs[:, 0]] \
+            - self.information_gain[pairs[:, 1]] \
+            + joint - joint_class
+
+    def joint_entropies(self, attrs, chi_square=False):
+        """
+        Return entropies of the joint distribution of attributes in each row
+        of `attrs`, an array of shape (k, m), without and with the class,
+        and, if `chi_square` is set, the chi-square statistics of
+        independence of the combined attributes and the class.
+
+        Rows with missing values of any of the attributes are skipped;
+        the latter entropies also skip rows with missing class.
+
+        If `keep_counts` is set, joint counts are kept (up to
+        `MAX_KEPT_CELLS` cells) so that `append` can update them and
+        entropies of these combinations are later computed without counting.
+
+        Joint entropies, and thus also triples, measures other than
+        interactions and scores of targets, need encoded data; other
+        backends raise a `ValueError`.
+        """
+        if self.backend != InteractionScorer.BINCOUNT:
+            raise ValueError("joint entropies need encoded data")
+        attrs = np.asarray(attrs, dtype=np.intp)
+        joint, joint_class = np.empty(len(attrs)), np.empty(len(attrs))
+        chi2 = np.empty(len(attrs))
+        keys = [tuple(row) for row in attrs.tolist()]
+        # counts may be released by another thread while scoring
+        kept_counts = self.counts
+        kept = np.array([key in kept_counts for key in keys], dtype=bool)
+        if kept.any():
+            indices = np.flatnonzero(kept)
+            counts = np.concatenate([kept_counts[keys[i]] for i in indices])
+            joint[indices], joint_class[indices] = \
+                self._entropies(attrs[indices], counts)
+            if chi_square:
+                chi2[indices] = self._chi_squares(attrs[indices], counts)
+
+        indices = np.flatnonzero(~kept)
+        packed = self.packable(attrs[indices])
+        for indices, count in (
+                (indices[packed], self._count_packed),
+                (indices[~packed],
+                 lambda block: self._count_block(block, self.row_chunks()))):
+            block_size = self.block_size
+            for start in range(0, len(indices), block_size):
+                block = indices[start:start + block_size]
+                counts, starts, sizes = count(attrs[block])
+                self._keep([keys[i] for i in block], counts, starts, sizes)
+                joint[block], joint_class[block] = \
+                    self._entropies(attrs[block], counts)
+                if chi_square:
+                    chi2[block] = self._chi_squares(attrs[block], counts)
+        if chi_square:
+            return joint, joint_class, chi2
+        return joint, joint_class
+
+    def packable(self, attrs):
+        """
+        Tell for each row of `attrs` whether its joint counts are computed
+        by `_count_packed`: if all attributes and the class have few values
+        and there are enough rows.
+        """
+        if self.n_rows < self.MIN_PACKED_ROWS \
+                or self.class_cardinality > self.MAX_PACKED_CARDINALITY:
+            return np.zeros(len(attrs), dtype=bool)
+        return np.all(self.cardinalities[attrs] <= self.MAX_PACKED_CARDINALITY,
+                      axis=1)
+
+    def packed_bits(self):
+        """
+        Return bit vectors of rows with each value of attributes with at most
+        `MAX_PACKED_CARDINALITY` values, packed into uint64 words, the index
+        of the first vector of each attribute (-1 for others), and vectors
+        of values of the class. Missing values have no vectors.
+        Vectors are computed once.
+        """
+        if self._bits is None:
+            cardinalities = np.asarray(self.cardinalities)
+            low = np.flatnonzero(cardinalities <= self.MAX_PACKED_CARDINALITY)
+            offsets = np.full(len(cardinalities), -1)
+            offsets[low] = np.cumsum(cardinalities[low]) - cardinalities[low]
+            n_words = -(-self.n_rows // 64)
+            bits = np.zeros((cardinalities[low].sum(), n_words), dtype=np.uint64)
+            class_bits = np.zeros((self.class_cardinality, n_words),
+                                  dtype=np.uint64)
+            step = max(self.CHUNK_ROWS // 64, 1) * 64
+            for first in range(0, self.n_rows, step):
+                rows = slice(first, min(first + step, self.n_rows))
+                words = slice(first // 64, -(-rows.stop // 64))
+                codes = self.codes[rows]
+                for attr in low:
+                    values = np.arange(cardinalities[attr])[:, None]
+                    bits[offsets[attr]:offsets[attr] + len(values), words] = \
+                        pack_rows(codes[:, attr] == values)
+                values = np.arange(self.class_cardinality)[:, None]
+                class_bits[:, words] = pack_rows(self.class_codes[rows] == values)
+            self._bits = bits, offsets, class_bits
+        return self._bits
+
+    def _count_packed(self, attrs):
+        """
+        Count joint values as `_count_block`, for attributes and the class
+        with few values: rows with a combination of values are found by
+        ``&`` of bit vectors and counted by popcount, without computing
+        a key for each row.
+
+        Attributes are grouped by cardinalities, so each group is counted
+        by operations on arrays of shape (pairs, values, ..., words);
+        words are processed in chunks to bound memory.
+        Cells with missing values of attributes are left empty, as their
+        counts are not used.
+        """
+        bits, offsets, class_bits = self.packed_bits()
+        cardinalities = self.cardinalities[attrs]
+        radices = cardinalities + 1
+        n_classes = self.class_cardinality + 1
+        sizes = radices.prod(axis=1)
+        starts = np.cumsum(sizes) - sizes
+        counts = np.zeros((sizes.sum(), n_classes), dtype=np.int64)
+        n_attrs = attrs.shape[1]
+        groups, inverse = np.unique(cardinalities, axis=0, return_inverse=True)
+        step = max(self.CHUNK_ROWS // 64, 1)
+        for group, cards in enumerate(groups):
+            members = np.flatnonzero(inverse.ravel() == group)
+            # cells of combinations of values, within ranges of members
+            cells = joint_keys(np.indices(cards).reshape(n_attrs, -1),
+                               cards + 1)
+            rows = starts[members, None] + cells
+            for first in range(0, bits.shape[1], step):
+                words = slice(first, first + step)
+                joint = None
+                for i, card in enumerate(cards):
+                    vectors = bits[offsets[attrs[members, i], None]
+                                   + np.arange(card), words]
+                    shape = (len(members),) + (1,) * i + (card,) \
+                        + (1,) * (n_attrs - i - 1) + (vectors.shape[-1],)
+                    vectors = vectors.reshape(shape)
+                    joint = vectors if joint is None else joint & vectors
+                joint = joint.reshape(len(members), len(cells), -1)
+                total = popcount(joint).sum(axis=-1, dtype=np.int64)
+                by_class = popcount(joint[:, :, None] & class_bits[:, words]) \
+                    .sum(axis=-1, dtype=np.int64)
+                counts[rows, :-1] += by_class
+                counts[rows, -1] += total - by_class.sum(axis=-1)
+        return counts, starts, sizes
+
+    def release_counts(self):
+        """Drop joint counts kept for `append`."""
+        self.counts = {}
+        self.n_kept_cells = 0
+
+    def _keep(self, keys, counts, starts, sizes):
+        """Keep joint counts for `append`, if `keep_counts` is set."""
+        if not self.keep_counts:
+            return
+        for key, first, size in zip(keys, starts, sizes):
+            if self.n_kept_cells + counts[first].size * size \
+                    > self.MAX_KEPT_CELLS:
+                break
+            self.counts[key] = counts[first:first + size].copy()
+            self.n_kept_cells += counts[first].size * size
+
+    def _count_block(self, attrs, row_chunks):
+        """
+        Count joint values of attributes in each row of `attrs` and the
+        class in the given chunks of rows. Every row of attrs gets
+        a contiguous range of cells; return the counts of shape
+        (cells, classes) and the first cell and number of cells of each row.
+        """
+        radices = self.cardinalities[attrs] + 1
+        n_classes = self.class_cardinality + 1
+        sizes = radices.prod(axis=1)
+        starts = np.cumsum(sizes) - sizes
+        counts = np.zeros(sizes.sum() * n_classes, dtype=np.int64)
+        for rows in row_chunks:
+            codes = self.codes[rows]
+            keys = np.zeros((len(attrs), len(codes)), dtype=np.int64)
+            for i in range(attrs.shape[1]):
+                keys *= radices[:, i, None]
+                keys += np.take(codes, attrs[:, i], axis=1).T
+            keys += starts[:, None]
+            keys *= n_classes
+            keys += self.class_codes[rows]
+            counts += np.bincount(keys.ravel(), minlength=len(counts))
+        return counts.reshape(-1, n_classes), starts, sizes
+
+    def _entropies(self, attrs, counts):
+        """
+        Return joint entropies, without and with the class, from `counts`
+        of attributes in rows of `attrs` as given by `_count_block`.
+        Counts are modified.
+        """
+        cardinalities = self.cardinalities[attrs]
+        radices = cardinalities + 1
+        n_classes = counts.shape[1]
+        sizes = radices.prod(axis=1)
+        starts = np.cumsum(sizes) - sizes
+
+        # clear cells with missing values of any attribute
+        cell_attrs = np.repeat(np.arange(len(attrs)), sizes)
+        cells = np.arange(len(cell_attrs)) - starts[cell_attrs]
+        missing = np.zeros(len(cells), dtype=bool)
+        for i in reversed(range(attrs.shape[1])):
+            radix = radices[cell_attrs, i]
+            missing |= cells % radix == cardinalities[cell_attrs, i]
+            cells //= radix
+        counts[missing] = 0
+
+        return segment_entropies(counts.sum(axis=1), starts), \
+            segment_entropies(counts[:, :-1].ravel(), starts * (n_classes - 1))
+
+    def _chi_squares(self, attrs, counts):
+        """
+        Return chi-square statistics of the contingency of combined values
+        of attributes in rows of `attrs` and the class, from `counts`
+        cleared of missing values by `_entropies`.
+        """
+        sizes = (self.cardinalities[attrs] + 1).prod(axis=1)
+        starts = np.cumsum(sizes) - sizes
+        observed = counts[:, :-1].astype(float)
+        cell_attrs = np.repeat(np.arange(len(attrs)), sizes)
+        totals = np.add.reduceat(observed.sum(axis=1), starts)
+        class_totals = np.add.reduceat(observed, starts)
+        expected = observed.sum(axis=1)[:, None] * class_totals[cell_attrs] \
+            / np.maximum(totals, 1)[cell_attrs, None]
+        terms = np.divide((observed - expected) ** 2, expected,
+                          out=np.zeros_like(observed), where=expected > 0)
+        return np.add.reduceat(terms.sum(axis=1), starts)
+
+    def score_measures(self, pairs, measures):
+        """
+        Compute `measures` (see :obj:`Measure`) for an array of attribute
+        pairs of shape (k, 2); return an array of shape (k, measures).
+
+        All measures are derived from the same joint counts, so pairs are
+        counted once regardless of the number of measures:
+
+        - interaction, as in `score_pairs`,
+        - symmetric uncertainty of the combined attributes and the class,
+          ``2 I(AB; Y) / (H(AB) + H(Y))``,
+        - conditional mutual information of attributes given the class,
+          ``I(A; B | Y)``,
+        - chi-square statistic of independence of the combined attributes
+          and the class.
+        """
+        pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+        a, b = pairs.T
+        joint, joint_class, *chi2 = self.joint_entropies(
+            pairs, chi_square=Measure.CHI_SQUARE in measures)
+        interaction = self.class_entropy \
+            - self.information_gain[a] - self.information_gain[b] \
+            + joint - joint_class
+        gain = self.class_entropy + joint - joint_class
+        total = joint + self.class_entropy
+        scores = {
+            Measure.INTERACTION: lambda: interaction,
+            Measure.SYMMETRIC_UNCERTAINTY: lambda: np.divide(
+                2 * gain, total, out=np.zeros(len(pairs)), where=total > 0),
+            Measure.CONDITIONAL_MI: lambda: interaction
+            + self.entropies[a] + self.entropies[b] - joint,
+            Measure.CHI_SQUARE: lambda: chi2[0]}
+        return np.column_stack([scores[measure]() for measure in measures]) \
+            .reshape(len(pairs), len(measures))
+
+    def normalized_measures(self, pairs, measures):
+        """
+        Return `measures` of pairs as `score_measures`, with interactions
+        and conditional mutual information normalized like in
+        `normalized_scores`.
+        """
+        scores = self.score_measures(pairs, measures)
+        for i, measure in enumerate(measures):
+            if measure in (Measure.INTERACTION, Measure.CONDITIONAL_MI):
+                scores[:, i] = self.normalize(scores[:, i])
+        return scores
+
+    @property
+    def tile_size(self):
+        """
+        Number of attributes on each side of a tile of `score_tile`,
+        so that keys of a tile fit into `MAX_KEYS`.
+        """
+        return max(1, int(np.sqrt(self.block_size)))
+
+    def score_tile(self, first, second, mask=None):
+        """
+        Compute interactions of each attribute in `first` with each in
+        `second`; return an array of shape (len(first), len(second)).
+
+        If `mask`, an array of the same shape, is given, only pairs where
+        it is set are scored and others are zero; the mask must be the same
+        for both orders of a pair. A pair that appears in both orders (as in
+        tiles on the diagonal) is scored once, and pairs of an attribute
+        with itself are zero.
+
+        Pairs with kept counts or whose attributes have few values are
+        scored as in `score_pairs`. For others, codes of both blocks of
+        attributes are taken once in each chunk of rows and combined into
+        keys of pairs, instead of gathering two columns for every pair.
+        """
+        first = np.asarray(first, dtype=np.intp)
+        second = np.asarray(second, dtype=np.intp)
+        todo = first[:, None] != second
+        if mask is not None:
+            todo &= mask
+        mirrored = np.isin(first, second)[:, None] & np.isin(second, first)
+        todo &= ~mirrored | (first[:, None] < second)
+        ia, ib = np.nonzero(todo)
+        pairs = np.column_stack((first[ia], second[ib]))
+        if self.backend != InteractionScorer.BINCOUNT:
+            scores = self.score_pairs(pairs)
+        else:
+            scores = np.empty(len(pairs))
+            direct = self.packable(pairs) | np.array(
+                [key in self.counts for key in map(tuple, pairs.tolist())],
+                dtype=bool)
+            if direct.any():
+                scores[direct] = self.score_pairs(pairs[direct])
+            rest = np.flatnonzero(~direct)
+            if len(rest):
+                counts, starts, sizes = \
+                    self._count_tile(first, second, ia[rest], ib[rest])
+                self._keep([tuple(pair) for pair in pairs[rest].tolist()],
+                           counts, starts, sizes)
+                joint, joint_class = self._entropies(pairs[rest], counts)
+                scores[rest] = self.class_entropy \
+                    - self.information_gain[pairs[rest, 0]] \
+                    - self.information_gain[pairs[rest, 1]] \
+                    + joint - joint_class
+
+        tile = np.zeros((len(first), len(second)))
+        tile[ia, ib] = scores
+        both = mirrored[ia, ib]
+        if both.any():
+            order1, order2 = np.argsort(first), np.argsort(second)
+            tile[order1[np.searchsorted(first, pairs[both, 1], sorter=order1)],
+                 order2[np.searchsorted(second, pairs[both, 0],
+                                        sorter=order2)]] = scores[both]
+        return tile
+
+    def _count_tile(self, first, second, ia, ib):
+        """
+        Count joint values of pairs of the `ia`-th attribute of `first` and
+        the `ib`-th of `second` and the class, as `_count_block`.
+        """
+        n_classes = self.class_cardinality + 1
+        radices = self.cardinalities[second] + 1
+        sizes = (self.cardinalities[first] + 1)[ia] * radices[ib]
+        starts = np.cumsum(sizes) - sizes
+        counts = np.zeros(sizes.sum() * n_classes, dtype=np.int64)
+        # cells of pairs, scaled by the number of classes
+        offsets = (starts * n_classes)[:, None]
+        scales = (radices * n_classes)[ib, None]
+        for rows in self.row_chunks():
+            codes = self.codes[rows]
+            # codes of both blocks are taken once per chunk
+            block1 = np.take(codes, first, axis=1).T.astype(np.int64)
+            block2 = np.take(codes, second, axis=1).T.astype(np.int64)
+            block2 *= n_classes
+            block2 += self.class_codes[rows]
+            keys = block1[ia]
+            keys *= scales
+            keys += block2[ib]
+            keys += offsets
+            counts += np.bincount(keys.ravel(), minlength=len(counts))
+        return counts.reshape(-1, n_classes), starts, sizes
+
+    def score_feature(self, attr, others=None):
+        """
+        Compute interactions of `attr` with each of `others` (by default,
+        all other attributes) in a single pass over rows.
+
+        Joint counts of all pairs share one buffer. In each chunk of rows,
+        codes of `attr` and of the class are combined once, and then with
+        columns of other attributes, `block_size` at a time.
+        """
+        if others is None:
+            others = np.delete(np.arange(len(self.information_gain)), attr)
+        others = np.asarray(others, dtype=np.intp)
+        pairs = np.column_stack((np.full(len(others), attr), others))
+        if self.backend != InteractionScorer.BINCOUNT:
+            return self.score_pairs(pairs)
+
+        n_classes = self.class_cardinality + 1
+        radices = self.cardinalities[others] + 1
+        sizes = (self.cardinalities[attr] + 1) * radices
+        starts = np.cumsum(sizes) - sizes
+        counts = np.zeros(sizes.sum() * n_classes, dtype=np.int64)
+        block_size = self.block_size
+        for rows in self.row_chunks():
+            codes = self.codes[rows]
+            # cells of attr and the class, common to all pairs
+            common = codes[:, attr].astype(np.int64)
+            common *= n_classes
+            for start in range(0, len(others), block_size):
+                block = slice(start, start + block_size)
+                keys = np.take(codes, others[block], axis=1).T.astype(np.int64)
+                keys *= n_classes
+                keys += self.class_codes[rows]
+                keys += common * radices[block, None]
+                keys += starts[block, None] * n_classes
+                counts += np.bincount(keys.ravel(), minlength=len(counts))
+        counts = counts.reshape(-1, n_classes)
+        self._keep([tuple(pair) for pair in pairs.tolist()],
+                   counts, starts, sizes)
+
+        joint, joint_class = self._entropies(pairs, counts)
+        return self.class_entropy - self.information_gain[attr] \
+            - self.information_gain[others] + joint - joint_class
+
+    def target_gains(self):
+        """
+        Return entropies of targets, an array of shape (targets, ), and
+        information gains of attributes about each target, of shape
+        (targets, attributes), computed as for the class in `preprocess`.
+        Values are computed once.
+        """
+        if self._target_gains is None:
+            n_targets = len(self.target_cardinalities)
+            target_counts = [np.zeros(card + 1, dtype=np.int64)
+                             for card in self.target_cardinalities]
+            attr_counts = [[np.zeros((card + 1, target_card + 1), dtype=np.int64)
+                            for card in self.cardinalities]
+                           for target_card in self.target_cardinalities]
+            for rows in self.row_chunks():
+                codes = self.codes[rows]
+                for t in range(n_targets):
+                    target = self.target_codes[rows, t]
+                    target_counts[t] += np.bincount(
+                        target, minlength=len(target_counts[t]))
+                    for attr, counts in enumerate(attr_counts[t]):
+                        counts += joint_counts((codes[:, attr], target),
+                                               counts.shape)
+            entropies = np.array([entropy_from_counts(counts[:-1])
+                                  for counts in target_counts])
+            gains = np.array([
+                [entropies[t] + entropy_from_counts(counts[:-1].sum(axis=1))
+                 - entropy_from_counts(counts[:-1, :-1])
+                 for counts in attr_counts[t]]
+                for t in range(n_targets)]).reshape(n_targets, -1)
+            self._target_gains = entropies, gains
+        return self._target_gains
+
+    def score_targets(self, pairs):
+        """
+        Compute interactions of an array of attribute pairs of shape (k, 2)
+        with the class and with each of its targets separately;
+        return an array of shape (k, 1 + targets).
+
+        Keys of joint values of pairs are computed once for each chunk of
+        rows and then combined with codes of the class and of each target,
+        so all scores take a single pass over the data.
+        """
+        if self.backend != InteractionScorer.BINCOUNT:
+            raise ValueError("scores of targets need encoded data")
+        pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+        targets = [(self.class_codes, self.class_cardinality)] \
+            + [(self.target_codes[:, t], int(card))
+               for t, card in enumerate(self.target_cardinalities)]
+        entropies, gains = self.target_gains()
+        entropies = np.concatenate(([self.class_entropy], entropies))
+        gains = np.vstack((self.information_gain, gains))
+
+        radices = self.cardinalities[pairs] + 1
+        scores = np.empty((len(pairs), len(targets)))
+        block_size = self.block_size
+        for first in range(0, len(pairs), block_size):
+            block = pairs[first:first + block_size]
+            sizes = radices[first:first + block_size].prod(axis=1)
+            starts = np.cumsum(sizes) - sizes
+            counts = [np.zeros(sizes.sum() * (card + 1), dtype=np.int64)
+                      for _, card in targets]
+            for rows in self.row_chunks():
+                codes = self.codes[rows]
+                keys = np.take(codes, block[:, 0], axis=1).T.astype(np.int64)
+                keys *= radices[first:first + block_size, 1, None]
+                keys += np.take(codes, block[:, 1], axis=1).T
+                keys += starts[:, None]
+                for (target, card), target_counts in zip(targets, counts):
+                    target_keys = keys * (card + 1)
+                    target_keys += target[rows]
+                    target_counts += np.bincount(target_keys.ravel(),
+                                                 minlength=len(target_counts))
+            for t, ((_, card), target_counts) in enumerate(zip(targets, counts)):
+                joint, joint_class = self._entropies(
+                    block, target_counts.reshape(-1, card + 1))
+                scores[first:first + block_size, t] = entropies[t] \
+                    - gains[t, block[:, 0]] - gains[t, block[:, 1]] \
+                    + joint - joint_class
+        return scores
+
+    def permutation_p_values(self, pairs, n_permutations=100, seed=0):
+        """
+        Return p-values of interactions of an array of attribute pairs
+        by a permutation test: the class is shuffled `n_permutations` times,
+        and the p-value is the share of all permutations, including
+        the data itself, with an interaction at least as far from zero
+        as observed (synergies and redundancies are both of interest).
+
+        Joint counts of pairs with all permutations of the class are
+        computed at once, as a product of indicator matrices of cells of
+        pairs (pairs x cells, rows) and of permuted classes (rows,
+        permutations x classes), for blocks of pairs and chunks of rows
+        of at most `MAX_KEYS` elements. Shuffling does not change entropies
+        of the class and of attributes, so only the joint entropies with
+        the class are computed anew.
+        """
+        pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+        if self.backend != InteractionScorer.BINCOUNT:
+            raise ValueError("permutation tests need encoded data")
+        classes = self.permuted_classes(n_permutations, seed)
+        n_perms = n_permutations + 1
+        n_classes = self.class_cardinality + 1
+        # columns of permutations and classes
+        offsets = np.arange(n_perms) * n_classes
+
+        radices = self.cardinalities[pairs] + 1
+        sizes = radices.prod(axis=1)
+        n_rows = max(1, min(self.n_rows, self.MAX_KEYS // (n_perms * n_classes)))
+        block_size = max(1, self.MAX_KEYS // (n_rows * sizes.max(initial=1)))
+        # counts are exact in float32 up to 2 ** 24
+        dtype = np.float32 if self.n_rows < 1 << 24 else np.float64
+        p_values = np.empty(len(pairs))
+        for start in range(0, len(pairs), block_size):
+            block = slice(start, start + block_size)
+            a, b = pairs[block].T
+            starts = np.cumsum(sizes[block]) - sizes[block]
+            counts = np.zeros((sizes[block].sum(), n_perms * n_classes))
+            for first in range(0, self.n_rows, n_rows):
+                rows = slice(first, first + n_rows)
+                codes = self.codes[rows]
+                n_chunk = len(codes)
+                cells = np.take(codes, a, axis=1).T.astype(np.int64)
+                cells *= radices[block, 1, None]
+                cells += np.take(codes, b, axis=1).T
+                cells += starts[:, None]
+                pair_cells = np.zeros((len(counts), n_chunk), dtype=dtype)
+                pair_cells[cells, np.arange(n_chunk)] = 1
+                class_cells = np.zeros((n_chunk, n_perms * n_classes),
+                                       dtype=dtype)
+                class_cells[np.arange(n_chunk)[:, None],
+                            classes[rows] + offsets] = 1
+                counts += pair_cells @ class_cells
+            counts = np.rint(counts).astype(np.int64)
+            for i, pair in enumerate(pairs[block]):
+                first = starts[i]
+                pair_counts = counts[first:first + sizes[block][i]] \
+                    .reshape(tuple(radices[block][i]) + (n_perms, n_classes)) \
+                    .transpose(2, 0, 1, 3)
+                scores = np.abs(self._permuted_scores(pair, pair_counts))
+                p_values[start + i] = \
+                    np.count_nonzero(scores >= scores[0] - 1e-12) / n_perms
+        return p_values
+
+    def permuted_classes(self, n_permutations, seed=0):
+        """
+        Return class codes of the data and of `n_permutations` shuffles of
+        the class, of shape (rows, permutations + 1) and a compact type.
+
+        Permutations are generated once for given `n_permutations` and
+        `seed` and reused by later calls, so that chunks of pairs tested
+        separately are tested on the same permutations.
+        """
+        key = (n_permutations, seed)
+        if self._permutations is None or self._permutations[0] != key:
+            self._permutations = None
+            rng = np.random.default_rng(seed)
+            classes = empty_codes(
+                (self.n_rows, n_permutations + 1),
+                code_dtype(self.class_cardinality + 1), self.on_disk)
+            classes[:, 0] = self.class_codes
+            for i in range(1, n_permutations + 1):
+                classes[:, i] = rng.permutation(self.class_codes)
+            self._permutations = key, classes
+        return self._permutations[1]
+
+    def _permuted_scores(self, pair, counts):
+        """
+        Return interactions of `pair` from its joint `counts` with permuted
+        classes, of shape (permutations, values, values, classes).
+        """
+        def entropies(counts):
+            counts = counts.reshape(len(counts), -1)
+            totals = counts.sum(axis=1).astype(float)
+            plogp = (counts * np.log2(np.maximum(counts, 1))).sum(axis=1)
+            return np.log2(np.maximum(totals, 1)) \
+                - plogp / np.maximum(totals, 1)
+
+        a, b = pair
+        card_a, card_b = self.cardinalities[pair]
+        n_classes = self.class_cardinality
+        ay = entropies(counts[:, :card_a, :, :n_classes].sum(axis=2))
+        by = entropies(counts[:, :, :card_b, :n_classes].sum(axis=1))
+        ab = entropies(counts[:, :card_a, :card_b].sum(axis=3))
+        aby = entropies(counts[:, :card_a, :card_b, :n_classes])
+        return ay + by + ab - aby - self.class_entropy \
+            - self.entropies[a] - self.entropies[b]
+
+    def pair_entropies(self, pairs):
+        """
+        Return joint entropies of pairs, without and with the class, as in
+        `joint_entropies`. Results are cached, since pairs are shared by
+        many triples of attributes.
+        """
+        pairs = np.sort(np.asarray(pairs, dtype=np.intp).reshape(-1, 2), axis=1)
+        keys = [tuple(pair) for pair in pairs.tolist()]
+        missing = [key for key in dict.fromkeys(keys)
+                   if key not in self.pair_cache]
+        if missing:
+            self.pair_cache.update(zip(missing, zip(*self.joint_entropies(missing))))
+        return np.array([self.pair_cache[key] for key in keys]).reshape(-1, 2).T
+
+    def score_triples(self, triples):
+        """
+        Compute three-way interactions of attributes with the class,
+        for an array of attribute triples of shape (k, 3).
+
+        This is the interaction information of four variables,
+        the alternating sum of entropies of all their subsets. Entropies of
+        single attributes and of pairs (with and without the class) are
+        taken from precomputed values and the cache of `pair_entropies`,
+        so only the joint counts of triples are new.
+        """
+        triples = np.asarray(triples, dtype=np.intp).reshape(-1, 3)
+        a, b, c = triples.T
+        singles = self.entropies[a] + self.entropies[b] + self.entropies[c]
+        with_class = 3 * self.class_entropy + singles \
+            - self.information_gain[a] - self.information_gain[b] \
+            - self.information_gain[c]
+        ab, aby = self.pair_entropies(triples[:, [0, 1]])
+        ac, acy = self.pair_entropies(triples[:, [0, 2]])
+        bc, bcy = self.pair_entropies(triples[:, [1, 2]])
+        abc, abcy = self.joint_entropies(triples)
+        return singles + self.class_entropy \
+            - (ab + ac + bc + with_class) \
+            + (abc + aby + acy + bcy) \
+            - abcy
+
+    def upper_bound(self, pairs):
+        """
+        Return upper bounds of interactions of an array of attribute pairs.
+
+        Interaction of a pair equals the information gain of both attributes
+        together minus their separate gains, and the former cannot exceed
+        the class entropy. The bound is exact for data without missing
+        values; missing values are removed per entropy, which may break it.
+        """
+        pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+        return self.class_entropy \
+            - self.information_gain[pairs[:, 0]] \
+            - self.information_gain[pairs[:, 1]]
+
+    def normalized_scores(self, pairs):
+        """
+        Return normalized interactions and information gains of both
+        attributes for an array of attribute pairs, as shown in the widget.
+        """
+        pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+        scores = np.column_stack((self.score_pairs(pairs),
+                                  self.information_gain[pairs[:, 0]],
+                                  self.information_gain[pairs[:, 1]]))
+        return self.normalize(scores)
+
     def normalize(self, score):
         return score / self.class_entropy
+
+
+def stratified_sample(class_codes, size, rng):
+    """
+    Return indices of a random sample of about `size` rows, in which
+    each class (and missing class) is represented proportionally.
+    """
+    n_rows = len(class_codes)
+    if size >= n_rows:
+        return rng.permutation(n_rows)
+    rows = []
+    for code in np.unique(class_codes):
+        members = np.flatnonzero(class_codes == code)
+        n_sampled = max(1, int(round(size * len(members) / n_rows)))
+        rows.append(rng.choice(members, n_sampled, replace=False))
+    return rng.permutation(np.concatenate(rows))
+
+
+class SampleScorer:
+    """
+    Approximate interactions on a stratified sample of rows.
+
+    Interactions are estimated on the whole sample. The sample is also
+    split into `n_splits` stratified folds, and the spread of fold scores
+    gives the half-width of a normal confidence interval around the
+    estimate, ``z * std / sqrt(n_splits)``.
+    """
+    def __init__(self, scorer, size, n_splits=4, z=1.96, seed=0):
+        rng = np.random.default_rng(seed)
+        rows = stratified_sample(scorer.class_codes, size, rng)
+        self.sample = scorer.subset(rows)
+        self.n_splits = n_splits
+        self.z = z
+
+        # deal rows of each class to folds in turn; rows are shuffled
+        folds = np.empty(len(rows), dtype=int)
+        sample_codes = scorer.class_codes[rows]
+        for code in np.unique(sample_codes):
+            members = np.flatnonzero(sample_codes == code)
+            folds[members] = np.arange(len(members)) % n_splits
+        self.splits = [scorer.subset(rows[folds == i])
+                       for i in range(n_splits)]
+
+    def score_pairs(self, pairs):
+        """Return estimated interactions and half-widths of their intervals."""
+        pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+        scores = self.sample.score_pairs(pairs)
+        split_scores = np.array([split.score_pairs(pairs)
+                                 for split in self.splits])
+        half_widths = self.z * split_scores.std(axis=0, ddof=1) \
+            / np.sqrt(self.n_splits)
+        return scores, half_widths
+
+
+class Heuristic:
+    """
+    Order of visiting pairs of attributes.
+
+    Apart from `TOP_K`, the order has a closed form: `index` gives the
+    position of a pair and `states_at` the pairs at positions, so
+    iteration can start anywhere without replaying earlier states.
+
+    If `left` attributes are given, only pairs of a left and a right
+    (any other) attribute are visited, in the same manner.
+    """
+    RANDOM, INFO_GAIN, TOP_K = 0, 1, 2
+    mode = {RANDOM: "Random Search",
+            INFO_GAIN: "Low Information Gain First",
+            TOP_K: "Top K (Prune by Upper Bound)"}
+    # number of states decoded at once by `generate_states`
+    BLOCK = 1024
+
+    def __init__(self, weights, mode=RANDOM, attributes=None, left=None):
+        """
+        Attributes are ordered by `weights` or randomly, depending on `mode`,
+        unless their order is given in `attributes` (e.g. to continue
+        a random search).
+        """
+        self.heuristic_mode = mode
+        self.weights = np.asarray(weights)
+        self.n_attributes = len(weights)
+        self.n_states = self.n_attributes * (self.n_attributes - 1) // 2
+        self.attributes = np.arange(self.n_attributes)
+        if attributes is not None:
+            self.attributes = np.asarray(attributes, dtype=np.intp)
+        elif mode in (Heuristic.INFO_GAIN, Heuristic.TOP_K):
+            self.attributes = self.attributes[np.argsort(weights)]
+        else:
+            np.random.shuffle(self.attributes)
+        self.positions = np.argsort(self.attributes)
+        self.first_index = self._first_index(np.arange(2 * self.n_attributes))
+
+        self.left = self.right = None
+        if left is not None:
+            is_left = np.zeros(self.n_attributes, dtype=bool)
+            is_left[left] = True
+            # both sides keep the order of attributes
+            self.left = self.attributes[is_left[self.attributes]]
+            self.right = self.attributes[~is_left[self.attributes]]
+            self.is_left = is_left
+            self.n_states = len(self.left) * len(self.right)
+            self.positions[self.left] = np.arange(len(self.left))
+            self.positions[self.right] = np.arange(len(self.right))
+            # pairs of positions (a, b) by increasing sum, then by a
+            sums = np.arange(len(self.left) + len(self.right) - 1)
+            counts = np.minimum(sums, len(self.left) - 1) + 1 \
+                - np.maximum(sums - len(self.right) + 1, 0)
+            self.first_index = np.concatenate(([0], np.cumsum(counts)))
+
+    def _first_index(self, s):
+        """
+        Return the index of the first pair of positions summing to `s`,
+        that is, the number of pairs with a lower sum.
+        """
+        over = np.maximum(s - self.n_attributes + 1, 0)
+        return s * s // 4 - over * (over - 1) // 2
+
+    def index(self, pairs):
+        """Return positions of `pairs` in the order of states."""
+        if self.heuristic_mode == Heuristic.TOP_K:
+            raise ValueError("top K order has no closed form")
+        pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+        if self.left is not None:
+            first_left = self.is_left[pairs[:, 0]]
+            a = self.positions[np.where(first_left, pairs[:, 0], pairs[:, 1])]
+            b = self.positions[np.where(first_left, pairs[:, 1], pairs[:, 0])]
+            s = a + b
+            return self.first_index[s] + a - np.maximum(s - len(self.right) + 1, 0)
+        positions = self.positions[pairs]
+        low, high = positions.min(axis=1), positions.max(axis=1)
+        s = low + high
+        return self._first_index(s) + low \
+            - np.maximum(s - self.n_attributes + 1, 0)
+
+    def states_at(self, indices):
+        """Return an array of pairs at `indices` in the order of states."""
+        if self.heuristic_mode == Heuristic.TOP_K:
+            raise ValueError("top K order has no closed form")
+        indices = np.asarray(indices, dtype=np.int64)
+        s = np.searchsorted(self.first_index, indices, side="right") - 1
+        if self.left is not None:
+            a = indices - self.first_index[s] \
+                + np.maximum(s - len(self.right) + 1, 0)
+            return np.column_stack((self.left[a], self.right[s - a]))
+        low = indices - self.first_index[s] \
+            + np.maximum(s - self.n_attributes + 1, 0)
+        return np.column_stack((self.attributes[low], self.attributes[s - low]))
+
+    def generate_states(self, start=0):
+        if self.heuristic_mode == Heuristic.TOP_K:
+            yield from islice(self._generate_by_sum(), start, None)
+            return
+        # prioritize two mid ranked attributes over highest first:
+        # pairs of positions by increasing sum, decoded in blocks
+        for first in range(start, self.n_states, self.BLOCK):
+            indices = np.arange(first, min(first + self.BLOCK, self.n_states))
+            yield from map(tuple, self.states_at(indices).tolist())
+
+    def _generate_by_sum(self):
+        # pairs by increasing sum of weights (information gains), which is
+        # the order of decreasing upper bound of interaction
+        if self.left is not None:
+            yield from self._generate_bipartite_by_sum()
+            return
+        weights = self.weights[self.attributes]
+        heap = [(weights[i] + weights[i + 1], i, i + 1)
+                for i in range(self.n_attributes - 1)]
+        heapify(heap)
+        while heap:
+            _, i, j = heap[0]
+            yield int(self.attributes[i]), int(self.attributes[j])
+            if j + 1 < self.n_attributes:
+                heapreplace(heap, (weights[i] + weights[j + 1], i, j + 1))
+            else:
+                heappop(heap)
+
+    def _generate_bipartite_by_sum(self):
+        left, right = self.weights[self.left], self.weights[self.right]
+        if not len(right):
+            return
+        heap = [(left[i] + right[0], i, 0) for i in range(len(left))]
+        heapify(heap)
+        while heap:
+            _, i, j = heap[0]
+            yield int(self.left[i]), int(self.right[j])
+            if j + 1 < len(right):
+                heapreplace(heap, (left[i] + right[j + 1], i, j + 1))
+            else:
+                heappop(heap)
+
+    def get_states(self, initial_state):
+        if initial_state is None:
+            return self.generate_states()
+        if self.heuristic_mode != Heuristic.TOP_K:
+            return self.generate_states(int(self.index(initial_state)[0]))
+        # the order of sums is only known by generating it
+        states = self.generate_states()
+        while next(states) != tuple(initial_state):
+            pass
+        return chain([tuple(initial_state)], states)
+
+
+class TopK:
+    """
+    Keep the `k` highest scores seen so far and prune states which cannot
+    get among them anymore.
+
+    States must be visited in order of decreasing `bound`, a function
+    returning an upper bound of the score for each of an array of states.
+    """
+    def __init__(self, k, bound, scores=()):
+        self.k = k
+        self.bound = bound
+        self.best = np.empty(0)
+        self.add(scores)
+
+    @property
+    def threshold(self):
+        """Score a state must exceed to get into the top `k`."""
+        return self.best.min() if len(self.best) == self.k else -np.inf
+
+    def add(self, scores):
+        scores = np.concatenate((self.best, np.asarray(scores, dtype=float)))
+        if len(scores) > self.k:
+            scores = np.partition(scores, -self.k)[-self.k:]
+        self.best = scores
+
+    def trim(self, states):
+        """
+        Return the leading states which may still get into the top `k`;
+        if shorter than `states`, no later state can either.
+        """
+        if not len(states):
+            return states
+        pruned = self.bound(states) <= self.threshold
+        return states[:np.argmax(pruned)] if pruned.any() else states
+
+
+class ResultCache:
+    """
+    A directory of results, stored as ``.npz`` files named by their keys.
+
+    Results are written by a background thread, shared by all caches;
+    `get` and `remove` first wait for a pending write of the same key.
+    When the files take more than `max_bytes`, the least recently used
+    are removed, but never the one just written. Results larger than
+    `max_bytes` are not stored at all. If `max_bytes` is `None`, results
+    are kept until removed.
+    """
+    # a single thread writes results of all caches, in order of `put`
+    _writer = ThreadPoolExecutor(1)
+    _pending = {}
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    @classmethod
+    def _wait(cls, path=None):
+        futures = list(cls._pending.values()) if path is None \
+            else [cls._pending.get(path)]
+        wait([future for future in futures if future is not None])
+
+    def flush(self):
+        """Wait until all results are written."""
+        self._wait()
+
+    def get(self, key):
+        """Return a dict of arrays stored under `key`, or `None`."""
+        path = self.path(key)
+        self._wait(path)
+        try:
+            with np.load(path) as stored:
+                arrays = dict(stored)
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError, BadZipFile):
+            return None
+        return arrays
+
+    def put(self, key, **arrays):
+        """
+        Store `arrays` under `key` in the background and remove old results
+        if needed. Arrays must not change afterwards.
+
+        Returns `False` and stores nothing if the arrays take more than
+        `max_bytes`.
+        """
+        if self.max_bytes is not None \
+                and sum(np.asarray(array).nbytes for array in arrays.values()) \
+                > self.max_bytes:
+            return False
+        path = self.path(key)
+        pending = ResultCache._pending
+        for done in [path for path, future in pending.items() if future.done()]:
+            del pending[done]
+        pending[path] = self._writer.submit(self._write, path, arrays)
+        return True
+
+    def _write(self, path, arrays):
+        temp_path = path + ".tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(temp_path, path)
+            if self.max_bytes is not None:
+                self.evict(keep=path)
+        except OSError:
+            # results are only cached if they can be
+            pass
+
+    def remove(self, key):
+        path = self.path(key)
+        self._wait(path)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self, keep=None):
+        """Remove the least recently used results, except those at `keep`."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+class ScoreStore:
+    """
+    Scores of pairs of attributes, in a dense triangular array of float32
+    indexed by pairs, with a mask of pairs whose scores are computed.
+
+    Pairs are unordered; pair ``(i, j)`` with ``i > j`` is stored at
+    ``i * (i - 1) // 2 + j``.
+
+    If `n_measures` is given, the store also keeps that many other measures
+    of each pair (see :obj:`Measure`), which are put along with scores.
+    """
+    def __init__(self, n_attrs, n_measures=0):
+        n_pairs = n_attrs * (n_attrs - 1) // 2
+        self.scores = np.zeros(n_pairs, dtype=np.float32)
+        self.computed = np.zeros(n_pairs, dtype=bool)
+        self.measures = None
+        if n_measures:
+            self.measures = np.zeros((n_pairs, n_measures), dtype=np.float32)
+
+    @staticmethod
+    def index(pairs):
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        high, low = pairs.max(axis=1), pairs.min(axis=1)
+        return high * (high - 1) // 2 + low
+
+    @staticmethod
+    def pairs(indices):
+        """Return pairs ``(i, j)``, ``i > j``, stored at `indices`."""
+        indices = np.asarray(indices, dtype=np.int64)
+        high = ((1 + np.sqrt(1 + 8 * indices.astype(float))) // 2) \
+            .astype(np.int64)
+        # correct rounding errors of the square root
+        high -= high * (high - 1) // 2 > indices
+        high += (high + 1) * high // 2 <= indices
+        return np.column_stack((high, indices - high * (high - 1) // 2))
+
+    def __len__(self):
+        return int(np.count_nonzero(self.computed))
+
+    def put(self, pairs, scores, measures=None):
+        indices = self.index(pairs)
+        self.scores[indices] = scores
+        if self.measures is not None:
+            self.measures[indices] = measures
+        self.computed[indices] = True
+
+    def get(self, pairs):
+        """Return scores of `pairs` and a mask of those that are computed."""
+        indices = self.index(pairs)
+        return self.scores[indices], self.computed[indices]
+
+    def is_computed(self, pair):
+        i, j = pair
+        return bool(self.computed[max(i, j) * (max(i, j) - 1) // 2 + min(i, j)])
+
+
+# scorer of a pool process, set up by `_init_worker`
+_worker_scorer = None
+
+
+def _init_worker(name, shape, dtype, cardinalities, class_cardinality,
+                 class_entropy, information_gain):
+    global _worker_scorer
+    shm = SharedMemory(name)
+    # the last column holds class codes
+    table = np.ndarray(shape, dtype=dtype, buffer=shm.buf, order="F")
+    _worker_scorer = InteractionScorer.from_codes(
+        table[:, :-1], cardinalities, table[:, -1], class_cardinality,
+        class_entropy, information_gain)
+    _worker_scorer.shm = shm  # keep the buffer alive
+
+
+def _normalized_scores(pairs):
+    return _worker_scorer.normalized_scores(pairs)
+
+
+class ProcessPoolScorer:
+    """
+    Score pairs with a pool of processes.
+
+    The code matrix of `scorer` and its class codes are copied into a
+    single block of shared memory, which workers map instead of receiving
+    a copy of the data. `submit` returns a future of `normalized_scores`.
+    """
+    def __init__(self, scorer, n_workers=None):
+        self.n_workers = n_workers or os.cpu_count() or 1
+        dtype = np.promote_types(scorer.codes.dtype, scorer.class_codes.dtype)
+        shape = (scorer.n_rows, scorer.codes.shape[1] + 1)
+        self.shm = SharedMemory(
+            create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+        table = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, order="F")
+        table[:, :-1] = scorer.codes
+        table[:, -1] = scorer.class_codes
+        del table
+
+        self.executor = ProcessPoolExecutor(
+            self.n_workers, mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.shm.name, shape, dtype, scorer.cardinalities,
+                      scorer.class_cardinality, scorer.class_entropy,
+                      scorer.information_gain))
+
+    def submit(self, pairs):
+        pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+        return self.executor.submit(_normalized_scores, pairs)
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.shutdown()
+
+
+class ThreadPoolScorer:
+    """
+    Score pairs with a pool of threads sharing `scorer`.
+
+    Threads need no copies of the data, and scale as far as the scoring
+    kernels release the GIL. `submit` returns a future of
+    `normalized_scores`.
+    """
+    def __init__(self, scorer, n_workers=None):
+        self.scorer = scorer
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(self.n_workers)
+
+    def submit(self, pairs):
+        pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+        return self.executor.submit(self.scorer.normalized_scores, pairs)
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.shutdown()
+
+
+def score_chunks(states, compute_scores, chunk_size, pool=None, top_k=None):
+    """
+    Score `states` in chunks of `chunk_size` and yield each chunk, its
+    scores and the state following it.
+
+    Chunks are scored by `compute_scores` or, if given, submitted to
+    `pool`; up to twice as many chunks as workers are in flight, but
+    chunks are still yielded in the order of states.
+
+    If `top_k` is given, states must come in order of decreasing upper
+    bound. First columns of scores are added to `top_k` and scoring stops
+    once no further state can get into the top.
+    """
+    states = iter(states)
+    pending = deque()
+    chunk = list(islice(states, chunk_size))
+    while chunk or pending:
+        next_chunk = list(islice(states, chunk_size))
+        if top_k is not None:
+            trimmed = top_k.trim(chunk)
+            if len(trimmed) < len(chunk):
+                chunk, next_chunk = trimmed, []
+        next_state = next_chunk[0] if next_chunk else None
+        if pool is None:
+            scores = compute_scores(chunk)
+            if top_k is not None:
+                top_k.add([score[0] for score in scores])
+            yield chunk, scores, next_state
+        else:
+            if chunk:
+                pending.append((chunk, pool.submit(chunk), next_state))
+            # keep all workers busy, but collect results in order
+            while pending and (not next_chunk
+                               or len(pending) > 2 * pool.n_workers
+                               or pending[0][1].done()):
+                done_chunk, future, done_state = pending.popleft()
+                scores = future.result()
+                if top_k is not None:
+                    top_k.add([score[0] for score in scores])
+                yield done_chunk, scores, done_state
+        chunk = next_chunk
+
+
+def rank_interactions(scorer, names, output, top_k=None, n_workers=1,
+                      threads=False, progress=None):
+    """
+    Score pairs of attributes with `scorer` and write them to `output`,
+    a ``.csv`` or ``.npz`` file; `names` are names of attributes.
+
+    Columns are the normalized interaction, information gains of both
+    attributes, and the attributes (names in csv, indices in npz).
+    Without `top_k`, all pairs are scored and rows are written in the order
+    in which pairs are scored, not sorted: csv rows are written as pairs
+    are scored, and rows for npz are collected in temporary memory-mapped
+    files, so memory does not depend on the number of pairs.
+    With `top_k`, pairs are visited by decreasing upper bound, only the
+    best `top_k` are kept and the search stops once no pair can get among
+    them; these rows are sorted by interaction.
+
+    Chunks are scored by `n_workers` processes, or threads if `threads`.
+    `progress`, if given, is called with the numbers of scored pairs and
+    of all pairs.
+    """
+    n_attrs = len(scorer.information_gain)
+    n_states = n_attrs * (n_attrs - 1) // 2
+    if top_k is not None:
+        states = Heuristic(scorer.information_gain, Heuristic.TOP_K) \
+            .get_states(None)
+        best = TopK(top_k, lambda pairs: scorer.normalize(scorer.upper_bound(pairs)))
+        chunk_size = min(scorer.block_size, max(top_k, 64))
+    else:
+        states = ((i, j) for i in range(n_attrs) for j in range(i))
+        best = None
+        chunk_size = scorer.block_size
+    pool = None
+    if n_workers > 1:
+        pool = (ThreadPoolScorer if threads else ProcessPoolScorer)(
+            scorer, n_workers)
+
+    header = ["interaction", "information_gain_1", "information_gain_2",
+              "feature_1", "feature_2"]
+    to_csv = not output.endswith(".npz")
+    stream = top_k is None
+    kept = []
+    n_done = 0
+    with ExitStack() as stack:
+        if pool is not None:
+            stack.callback(pool.shutdown)
+        if stream and to_csv:
+            writer = csv.writer(
+                stack.enter_context(open(output, "w", newline="")))
+            writer.writerow(header)
+        elif stream:
+            # rows for npz are collected on disk, scores and then pairs
+            tmp = stack.enter_context(TemporaryFile())
+            size = max(n_states, 1)
+            scores_out = np.memmap(tmp, dtype=np.float64, mode="w+",
+                                   shape=(size, 3))
+            pairs_out = np.memmap(tmp, dtype=np.int64, mode="r+",
+                                  offset=scores_out.nbytes, shape=(size, 2))
+        for chunk, scores, _ in score_chunks(
+                states, scorer.normalized_scores, chunk_size, pool, best):
+            rows = np.column_stack((np.asarray(scores).reshape(-1, 3),
+                                    np.asarray(chunk).reshape(-1, 2)))
+            if stream and to_csv:
+                writer.writerows(_csv_rows(rows, names))
+            elif stream:
+                scores_out[n_done:n_done + len(rows)] = rows[:, :3]
+                pairs_out[n_done:n_done + len(rows)] = rows[:, 3:]
+            else:
+                kept.append(rows)
+                if sum(map(len, kept)) > 2 * top_k:
+                    kept = [_best_rows(np.vstack(kept), top_k)]
+            n_done += len(chunk)
+            if progress is not None:
+                progress(n_done, n_states)
+        if stream and not to_csv:
+            np.savez(output, scores=scores_out[:n_done],
+                     pairs=pairs_out[:n_done], names=np.array(names))
+    if stream:
+        return
+
+    rows = _best_rows(np.vstack(kept) if kept else np.empty((0, 5)), top_k)
+    if to_csv:
+        with open(output, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(_csv_rows(rows, names))
+    else:
+        np.savez(output, scores=rows[:, :3], pairs=rows[:, 3:].astype(int),
+                 names=np.array(names))
+
+
+def matrix_tiles(n_attrs, tile_size):
+    """
+    Yield pairs of ranges of attributes that cover the upper triangle
+    (with the diagonal) of a matrix of `n_attrs` attributes in tiles of
+    `tile_size`; all tiles of a block of rows are yielded together.
+    """
+    for i in range(0, n_attrs, tile_size):
+        for j in range(i, n_attrs, tile_size):
+            yield np.arange(i, min(i + tile_size, n_attrs)), \
+                np.arange(j, min(j + tile_size, n_attrs))
+
+
+def put_tile(matrix, first, second, tile):
+    """
+    Put scores of pairs of `first` and `second` attributes into a symmetric
+    `matrix`, with zeros on the diagonal.
+    """
+    rows, columns = slice(first[0], first[-1] + 1), \
+        slice(second[0], second[-1] + 1)
+    matrix[rows, columns] = tile
+    matrix[columns, rows] = tile.T
+    diagonal = np.intersect1d(first, second)
+    matrix[diagonal, diagonal] = 0
+
+
+def interaction_matrix(scorer, out=None, tile_size=None, normalize=False,
+                       progress=None):
+    """
+    Compute the symmetric matrix of interactions of all pairs of attributes
+    with `scorer`, tile by tile (see `InteractionScorer.score_tile`);
+    the diagonal is zero.
+
+    Scores are written into `out`, a float32 array of shape (p, p), which
+    may be a ``np.memmap`` for many attributes; a new array is allocated
+    if not given. Tiles have `tile_size` attributes on each side, by
+    default `scorer.tile_size`. If `normalize` is set, interactions are
+    normalized like in `normalized_scores`. `progress`, if given, is called
+    with the numbers of computed tiles and of all tiles.
+    """
+    n_attrs = len(scorer.information_gain)
+    if out is None:
+        out = np.empty((n_attrs, n_attrs), dtype=np.float32)
+    tile_size = tile_size or scorer.tile_size
+    n_blocks = -(-n_attrs // tile_size)
+    n_tiles = n_blocks * (n_blocks + 1) // 2
+    for done, (first, second) in enumerate(matrix_tiles(n_attrs, tile_size)):
+        tile = scorer.score_tile(first, second)
+        put_tile(out, first, second,
+                 scorer.normalize(tile) if normalize else tile)
+        if progress is not None:
+            progress(done + 1, n_tiles)
+    return out
+
+
+def _best_rows(rows, k):
+    """Return at most `k` rows with the highest interactions, sorted."""
+    return rows[np.argsort(-rows[:, 0], kind="stable")[:k]]
+
+
+def _csv_rows(rows, names):
+    for *scores, attr1, attr2 in rows.tolist():
+        yield scores + [names[int(attr1)], names[int(attr2)]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m orangecontrib.prototypes.interactions",
+        description="Rank pairs of features by their interaction "
+                    "with the target.")
+    parser.add_argument("data",
+                        help="data file in any format Orange can read, or "
+                             ".npz with discretized values of features (X), "
+                             "the target (Y) and names of features (names)")
+    parser.add_argument("output", help="output file, .csv or .npz; "
+                                       "unsorted unless --top-k is given")
+    parser.add_argument("--top-k", type=int,
+                        help="only find the top K pairs, skipping pairs "
+                             "that cannot get among them, sorted by "
+                             "interaction")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes (default: 1)")
+    parser.add_argument("--threads", action="store_true",
+                        help="use threads instead of processes")
+    parser.add_argument("--quiet", action="store_true",
+                        help="do not report progress")
+    args = parser.parse_args(argv)
+
+    if args.data.endswith(".npz"):
+        with np.load(args.data) as arrays:
+            X, Y, names = arrays["X"], arrays["Y"], arrays["names"].tolist()
+    else:
+        # Orange is only needed for reading and discretizing other formats
+        from Orange.data import Table
+        from Orange.preprocess import Discretize, Remove
+
+        data = Discretize()(Remove(Remove.RemoveConstant)(Table(args.data)))
+        X, Y = data.X, data.Y
+        names = [attr.name for attr in data.domain.attributes]
+    if X.ndim != 2 or X.shape[1] < 2 or Y.size == 0:
+        parser.error("data needs a target and at least two features")
+    scorer = InteractionScorer.from_arrays(X, Y)
+
+    last = 0
+
+    def report(done, total):
+        nonlocal last
+        if time.monotonic() - last > 0.5 or done == total:
+            last = time.monotonic()
+            print(f"\r{done}/{total} pairs ({done * 100 // max(total, 1)}%)",
+                  end="", file=sys.stderr, flush=True)
+
+    rank_interactions(scorer, names, args.output, args.top_k, args.workers,
+                      args.threads, None if args.quiet else report)
+    if not args.quiet:
+        print(file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import time
+
 import numpy as np
 
 from AnyQt.QtCore import QModelIndex, Qt
@@ -35,6 +37,7 @@ class ArrayTableModel(PyTableModel):
         self._rows = 0  # current number of rows containing data
         self._max_view_rows = MAX_ROWS  # maximum number of rows the model/view will display
         self._max_data_rows = MAX_ROWS  # maximum allowed size for the `_data` array
+        self.sort_time = 0.  # seconds spent keeping the data sorted when it changes
         # ``__len__`` returns _rows: amount of existing data in the model
         # ``rowCount`` returns the lowest of `_rows` and `_max_view_rows`:
         # how large the model/view thinks it is
@@ -118,24 +121,63 @@ class ArrayTableModel(PyTableModel):
             self.endInsertRows()
 
         if self.sortColumn() >= 0:
+            start = time.perf_counter()
             old_rows = self._rows - n_rows
             self.extendSortFrom(old_rows)
+            self.sort_time += time.perf_counter() - start
+
+    def update(self, indices, rows: list[list[float]]):
+        """Replace rows at (unsorted) `indices` and keep the model sorted."""
+        if not len(indices):
+            return
+        indices = np.asarray(indices)
+        self._data[indices] = rows
+        self.dataChanged.emit(self.index(0, 0),
+                              self.index(self.rowCount() - 1, self._columns - 1))
+        if self.sortColumn() >= 0:
+            start = time.perf_counter()
+            self.sort(self.sortColumn(), self.sortOrder())
+            self.sort_time += time.perf_counter() - start
+
+    def insert_column(self, column: int, value=np.nan):
+        """Insert a column filled with `value` before `column`."""
+        self.beginInsertColumns(QModelIndex(), column, column)
+        self._data = np.insert(self._data, column, value, axis=1)
+        self._columns += 1
+        self.endInsertColumns()
+
+    def set_column(self, indices, column: int, values):
+        """Set `values` in `column` of rows at (unsorted) `indices`."""
+        if not len(indices):
+            return
+        self._data[np.asarray(indices), column] = values
+        self.dataChanged.emit(self.index(0, column),
+                              self.index(self.rowCount() - 1, column))
+        if self.sortColumn() == column:
+            start = time.perf_counter()
+            self.sort(column, self.sortOrder())
+            self.sort_time += time.perf_counter() - start
 
 
 class RankModel(ArrayTableModel):
     """
     Extends ``ArrayTableModel`` for ``VizRankDialog`` type widgets,
     to display scores for combinations of attributes.
+
+    The last `n_attr_columns` columns hold indices of attributes.
     """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.domain_model = DomainModel(DomainModel.ATTRIBUTES)
+        self.n_attr_columns = 2
 
-    def set_domain(self, domain: Domain):
+    def set_domain(self, domain: Domain, max_rows: int = None):
         self.domain_model.set_domain(domain)
-        n_attrs = len(domain.attributes)
-        self._max_data_rows = n_attrs * (n_attrs - 1) // 2
+        if max_rows is None:
+            n_attrs = len(domain.attributes)
+            max_rows = n_attrs * (n_attrs - 1) // 2
+        self._max_data_rows = max_rows
 
     def resetSorting(self):
         if self._data is None:
@@ -148,8 +190,9 @@ class RankModel(ArrayTableModel):
             return None
 
         column = index.column()
-        if column >= self.columnCount() - 2 and role != Qt.EditRole:
-            # use domain model for all data (except editrole) in last two columns
+        if column >= self.columnCount() - self.n_attr_columns \
+                and role != Qt.EditRole:
+            # use domain model for all data (except editrole) in attribute columns
             try:
                 row = self.mapToSourceRows(index.row())
                 value = self.domain_model.index(int(self._data[row, column]))
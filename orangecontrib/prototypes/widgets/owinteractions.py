@@ -1,19 +1,29 @@
-import copy
-from itertools import chain
-from threading import Lock, Timer
+import os
+import time
+from hashlib import blake2b
+from functools import partial
+from tempfile import TemporaryFile
+from threading import Lock
 from typing import Callable, Optional, Iterable
 import numpy as np
 
 from AnyQt.QtGui import QColor, QPainter, QPen
-from AnyQt.QtCore import QModelIndex, Qt, QLineF, QSortFilterProxyModel
+from AnyQt.QtCore import QModelIndex, Qt, QLineF, QSortFilterProxyModel, \
+    QTimer
 from AnyQt.QtWidgets import QTableView, QHeaderView, \
-    QStyleOptionViewItem, QApplication, QStyle, QLineEdit
+    QStyleOptionViewItem, QApplication, QStyle, QLineEdit, QListView
 
 from orangecontrib.prototypes.ranktablemodel import RankModel
-from orangecontrib.prototypes.interactions import InteractionScorer
+from orangecontrib.prototypes.interactions import InteractionScorer, \
+    ProcessPoolScorer, ThreadPoolScorer, SampleScorer, TopK, ResultCache, \
+    Heuristic, Measure, ScoreStore, score_chunks, matrix_tiles, put_tile, \
+    code_dtype
 
 from Orange.data import Table, Domain, Variable
-from Orange.preprocess import Discretize, Remove
+from Orange.misc import DistMatrix
+from Orange.misc.environ import cache_dir
+from Orange.preprocess import Remove
+from Orange.preprocess.discretize import EqualFreq
 from Orange.widgets import gui
 from Orange.widgets.widget import OWWidget, AttributeList, Msg
 from Orange.widgets.utils.widgetpreview import WidgetPreview
@@ -23,32 +33,273 @@ from Orange.widgets.utils.itemmodels import DomainModel
 from Orange.widgets.settings import Setting, ContextSetting, DomainContextHandler
 
 
+def spill_table(data: Table) -> Table:
+    """
+    Return a copy of `data` whose attribute values are stored in
+    a memory-mapped temporary file instead of in memory.
+    """
+    X = np.memmap(TemporaryFile(), dtype=data.X.dtype, mode="w+",
+                  shape=data.X.shape)
+    X[:] = data.X
+    return Table.from_numpy(data.domain, X, data.Y, data.metas, data.W,
+                            data.attributes, data.ids)
+
+
+class Preparation:
+    """Discretized data and its scorer, as returned by `prepare`."""
+    def __init__(self, data: Table, removed_constant: bool, spilled: bool):
+        self.data = data
+        self.removed_constant = removed_constant
+        self.spilled = spilled
+        self.scorer = None
+
+
+def prepare(data: Table, on_disk: bool, previous: Optional[Preparation],
+            task: TaskState) -> Optional[Preparation]:
+    """
+    Remove constant attributes from `data` and discretize the rest,
+    unless `previous` data, which are already discretized, are given.
+    Then move the data to disk if `on_disk` and construct a scorer.
+
+    Runs as the first stage of the concurrent task, before ranking.
+    Returns `None` if interrupted.
+    """
+    if previous is None:
+        task.set_status("Discretizing...")
+        remover = Remove(Remove.RemoveConstant)
+        data = remover(data)
+        method = EqualFreq()
+        attributes = []
+        n_attrs = len(data.domain.attributes)
+        for i, var in enumerate(data.domain.attributes):
+            if task.is_interruption_requested():
+                return None
+            task.set_progress_value(80 * i // n_attrs)
+            if var.is_continuous:
+                var = method(data, var)
+                # like `Discretize`, skip attributes with a single interval
+                if var is None or len(var.values) < 2:
+                    continue
+            attributes.append(var)
+        domain = Domain(attributes, data.domain.class_vars, data.domain.metas)
+        preparation = Preparation(data.transform(domain),
+                                  bool(remover.attr_results["removed"]), False)
+    else:
+        preparation = Preparation(previous.data, previous.removed_constant,
+                                  previous.spilled)
+    if len(preparation.data.domain.attributes) < 2 \
+            or task.is_interruption_requested():
+        return preparation
+
+    if on_disk and not preparation.spilled:
+        task.set_status("Moving data to disk...")
+        preparation.data = spill_table(preparation.data)
+        preparation.spilled = True
+    task.set_status("Counting values...")
+    task.set_progress_value(80)
+    scorer = InteractionScorer(preparation.data, on_disk=on_disk)
+    # keys of cached results and checkpoints are derived from the digest
+    # of all codes, so the widget only reads it
+    task.set_status("Hashing data...")
+    scorer.fingerprint()
+    preparation.scorer = scorer
+    return preparation
+
+
+class Refresh:
+    """
+    Input with appended rows, discretized data and rows of the model with
+    refreshed scores, as returned by `refresh`; `data` is `None` if
+    the scorer could not count the appended rows.
+    """
+    def __init__(self, input_data: Table, data: Optional[Table] = None,
+                 rows: Optional[np.ndarray] = None):
+        self.input_data = input_data
+        self.data = data
+        self.rows = rows
+
+
+def refresh(scorer: InteractionScorer, data: Table, input_data: Table,
+            spilled: bool, compute_scores: Callable, rows_for_states: Callable,
+            states: np.ndarray, chunk_size: int,
+            task: TaskState) -> Optional[Refresh]:
+    """
+    Discretize rows of `input_data` that follow those of `data` and add
+    them to `data` (on disk, if `spilled`) and to `scorer`. Then score
+    `states` again in chunks of `chunk_size` and return rows for the model.
+
+    Tasks run one at a time, so the previous task no longer reads the
+    scorer. Returns `None` if interrupted.
+    """
+    task.set_status("Counting appended rows...")
+    new = input_data[len(data):].transform(data.domain)
+    if not scorer.append(new.X, new.Y):
+        return Refresh(input_data)
+    data = Table.concatenate([data, new])
+    if spilled:
+        data = spill_table(data)
+    task.set_status("Hashing data...")
+    scorer.fingerprint()
+
+    task.set_status("Updating scores...")
+    rows = []
+    for start in range(0, len(states), chunk_size):
+        if task.is_interruption_requested():
+            return None
+        chunk = states[start:start + chunk_size]
+        rows.append(rows_for_states(compute_scores(chunk), chunk))
+        task.set_progress_value(
+            min(start + chunk_size, len(states)) * 100 // len(states))
+    return Refresh(input_data, data, np.vstack(rows) if rows else None)
+
+
+def compute_matrix(data: Table, scorer: InteractionScorer, store: ScoreStore,
+                   on_disk: bool, task: TaskState) -> Optional[DistMatrix]:
+    """
+    Compute the matrix of normalized interactions of all pairs of
+    attributes in tiles (see `interaction_matrix`). Pairs in `store` are
+    taken from it; only the remaining pairs of each tile are scored.
+    If `on_disk`, the matrix is memory-mapped to a temporary file.
+
+    Returns `None` if interrupted.
+    """
+    task.set_status("Computing the interaction matrix...")
+    n_attrs = len(scorer.information_gain)
+    if on_disk:
+        matrix = np.memmap(TemporaryFile(), dtype=np.float32, mode="w+",
+                           shape=(n_attrs, n_attrs))
+    else:
+        matrix = np.empty((n_attrs, n_attrs), dtype=np.float32)
+    tiles = list(matrix_tiles(n_attrs, scorer.tile_size))
+    for done, (first, second) in enumerate(tiles):
+        if task.is_interruption_requested():
+            return None
+        rows, columns = np.meshgrid(first, second, indexing="ij")
+        pairs = rows != columns
+        stored = np.zeros(rows.shape, dtype=bool)
+        scores, stored[pairs] = store.get(
+            np.column_stack((rows[pairs], columns[pairs])))
+        tile = scorer.normalize(
+            scorer.score_tile(first, second, pairs & ~stored))
+        tile[stored] = scores[stored[pairs]]
+        put_tile(matrix, first, second, tile)
+        task.set_progress_value((done + 1) * 100 // len(tiles))
+    return DistMatrix(matrix, data, data, axis=0)
+
+
 class ModelQueue:
+    """Blocks of rows waiting to be added to the model."""
     def __init__(self):
         self.mutex = Lock()
-        self.queue = []
+        self.blocks = []
         self.latest_state = None
 
-    def put(self, row, state):
+    def extend(self, rows, state):
         with self.mutex:
-            self.queue.append(row)
+            self.blocks.append(rows)
             self.latest_state = state
 
     def get(self):
         with self.mutex:
-            queue, self.queue = self.queue, []
+            blocks, self.blocks = self.blocks, []
             state, self.latest_state = self.latest_state, None
-        return queue, state
+        return np.vstack(blocks) if blocks else np.empty((0, 0)), state
 
 
-def run(compute_score: Callable, row_for_state: Callable,
+# minimal number of seconds between partial results
+FLUSH_INTERVAL = 0.05
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}"
+
+
+class RunStats:
+    """
+    Counters of a ranking, for the status line, the report and benchmarks.
+
+    The task adds the time spent scoring (including generating states)
+    and building and queueing rows; the widget adds the time spent adding
+    rows to the model and, separately, keeping it sorted.
+    Times are in seconds; `elapsed` excludes pauses.
+    """
+    def __init__(self):
+        self.n_scored = 0
+        self.scoring = 0.
+        self.queue = 0.
+        self.model = 0.
+        self.sort = 0.
+        self._elapsed = 0.
+        self._started = None
+
+    def start(self):
+        if self._started is None:
+            self._started = time.perf_counter()
+
+    def stop(self):
+        if self._started is not None:
+            self._elapsed += time.perf_counter() - self._started
+            self._started = None
+
+    @property
+    def elapsed(self):
+        if self._started is None:
+            return self._elapsed
+        return self._elapsed + time.perf_counter() - self._started
+
+    @property
+    def per_second(self):
+        elapsed = self.elapsed
+        return self.n_scored / elapsed if elapsed else 0.
+
+    def eta(self, remaining: int) -> Optional[float]:
+        """Return the number of seconds needed to score `remaining` states."""
+        per_second = self.per_second
+        return remaining / per_second if per_second else None
+
+    def summary(self) -> dict:
+        return {"scored": self.n_scored, "elapsed": self.elapsed,
+                "per_second": self.per_second, "scoring": self.scoring,
+                "queue": self.queue, "model": self.model, "sort": self.sort}
+
+    def status(self, remaining: int) -> str:
+        eta = self.eta(remaining)
+        return f"{self.per_second:.0f} per second, " \
+            f"ETA {'?' if eta is None else format_duration(eta)} " \
+            f"(scoring {self.scoring:.1f} s, queue {self.queue:.1f} s, " \
+            f"model {self.model:.1f} s, sorting {self.sort:.1f} s)"
+
+    def report_items(self):
+        return [("Scored combinations", self.n_scored),
+                ("Running time", format_duration(self.elapsed)),
+                ("Combinations per second", f"{self.per_second:.1f}"),
+                ("Scoring", f"{self.scoring:.2f} s"),
+                ("Queueing rows", f"{self.queue:.2f} s"),
+                ("Adding rows to the table", f"{self.model:.2f} s"),
+                ("Sorting the table", f"{self.sort:.2f} s")]
+
+
+def run(compute_scores: Callable, rows_for_states: Callable,
         iterate_states: Callable, saved_state: Optional[Iterable],
-        progress: int, state_count: int, task: TaskState):
+        progress: int, state_count: int, chunk_size: int,
+        make_pool: Optional[Callable], top_k: Optional[TopK],
+        task: TaskState, stats: Optional[RunStats] = None):
     """
     Replaces ``run_vizrank``, with some minor adjustments.
         - ``ModelQueue`` replaces ``queue.Queue``
-        - `row_for_state` can be called here, assuming we are not adding `Qt` objects to the model
+        - `rows_for_states` can be called here, assuming we are not adding `Qt` objects to the model
         - `scores` removed
+        - states are scored in chunks of `chunk_size` by `compute_scores`
+          (see :obj:`score_chunks`); each chunk becomes an array of rows,
+          and progress is reported once per chunk
+        - if `make_pool` is given, chunks are scored by the pool it returns;
+          results are still put into the queue in the order of states
+        - if `top_k` is given, states are visited in order of decreasing
+          upper bound and the search stops once no state can enter the top
+        - the number of scored states and times of scoring and queueing
+          are added to `stats`, if given
     """
     task.set_status("Getting combinations...")
     task.set_progress_value(0.1)
@@ -56,72 +307,50 @@ def run(compute_score: Callable, row_for_state: Callable,
 
     task.set_status("Getting scores...")
     queue = ModelQueue()
-    can_set_partial_result = True
+    last_flush = -np.inf
+    stats = stats or RunStats()
 
-    def do_work(st, next_st):
-        try:
-            score = compute_score(st)
-            if score is not None:
-                queue.put(row_for_state(score, st), next_st)
-        except Exception:
-            pass
-
-    def reset_flag():
-        nonlocal can_set_partial_result
-        can_set_partial_result = True
-
-    state = None
-    next_state = next(states)
+    pool = make_pool() if make_pool is not None else None
     try:
-        while True:
+        task.set_progress_value(progress * 100 // state_count)
+        tick = time.perf_counter()
+        for chunk, scores, next_state in score_chunks(
+                states, compute_scores, chunk_size, pool, top_k):
+            start = time.perf_counter()
+            stats.scoring += start - tick
+            stats.n_scored += len(chunk)
+            if len(chunk):
+                try:
+                    queue.extend(rows_for_states(scores, chunk), next_state)
+                except Exception:
+                    pass
+            progress += len(chunk)
             if task.is_interruption_requested():
                 return queue.get()
             task.set_progress_value(progress * 100 // state_count)
-            progress += 1
-            state = copy.copy(next_state)
-            next_state = copy.copy(next(states))
-            do_work(state, next_state)
             # for simple scores (e.g. correlations widget) and many feature
             # combinations, the 'partial_result_ready' signal (emitted by
             # invoking 'task.set_partial_result') was emitted too frequently
             # for a longer period of time and therefore causing the widget
             # being unresponsive
-            if can_set_partial_result:
+            if next_state is not None \
+                    and time.monotonic() - last_flush >= FLUSH_INTERVAL:
                 task.set_partial_result(queue.get())
-                can_set_partial_result = False
-                Timer(0.05, reset_flag).start()
-    except StopIteration:
-        do_work(state, None)
-        task.set_partial_result(queue.get())
+                last_flush = time.monotonic()
+            tick = time.perf_counter()
+            stats.queue += tick - start
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    task.set_partial_result(queue.get())
     return queue.get()
 
 
-class Heuristic:
-    RANDOM, INFO_GAIN = 0, 1
-    mode = {RANDOM: "Random Search",
-            INFO_GAIN: "Low Information Gain First"}
-
-    def __init__(self, weights, mode=RANDOM):
-        self.n_attributes = len(weights)
-        self.attributes = np.arange(self.n_attributes)
-        if mode == Heuristic.INFO_GAIN:
-            self.attributes = self.attributes[np.argsort(weights)]
-        else:
-            np.random.shuffle(self.attributes)
-
-    def generate_states(self):
-        # prioritize two mid ranked attributes over highest first
-        for s in range(1, self.n_attributes * (self.n_attributes - 1) // 2):
-            for i in range(max(s - self.n_attributes + 1, 0), (s + 1) // 2):
-                yield self.attributes[i], self.attributes[s - i]
-
-    def get_states(self, initial_state):
-        states = self.generate_states()
-        if initial_state is not None:
-            while next(states) != initial_state:
-                pass
-            return chain([initial_state], states)
-        return states
+class Execution:
+    SERIAL, PROCESSES, THREADS = 0, 1, 2
+    mode = {SERIAL: "Single Thread",
+            PROCESSES: "Multiple Processes",
+            THREADS: "Multiple Threads"}
 
 
 class InteractionItemDelegate(gui.TableBarItem):
@@ -155,10 +384,15 @@ class InteractionItemDelegate(gui.TableBarItem):
                 painter.drawLine(line)
 
             scorer = index.model().scorer
-            attr1 = self.cachedData(index.siblingAtColumn(2), Qt.EditRole)
-            attr2 = self.cachedData(index.siblingAtColumn(3), Qt.EditRole)
-            l_bar = scorer.normalize(scorer.information_gain[int(attr1)])
-            r_bar = scorer.normalize(scorer.information_gain[int(attr2)])
+            n_columns = index.model().columnCount()
+            if index.model().sourceModel().n_attr_columns == 2:
+                attr1 = self.cachedData(index.siblingAtColumn(n_columns - 2), Qt.EditRole)
+                attr2 = self.cachedData(index.siblingAtColumn(n_columns - 1), Qt.EditRole)
+                l_bar = scorer.normalize(scorer.information_gain[int(attr1)])
+                r_bar = scorer.normalize(scorer.information_gain[int(attr2)])
+            else:
+                # triples only show the interaction
+                l_bar = r_bar = 0
             # negative information gains stem from issues in interaction
             # calculation and may cause bars reaching out of intended area
             l_bar, r_bar = width * max(l_bar, 0), width * max(r_bar, 0)
@@ -194,9 +428,11 @@ class OWInteractions(OWWidget, ConcurrentWidgetMixin):
 
     class Inputs:
         data = Input("Data", Table)
+        left_features = Input("Left Features", AttributeList)
 
     class Outputs:
         features = Output("Features", AttributeList)
+        matrix = Output("Interaction Matrix", DistMatrix, dynamic=False)
 
     settingsHandler = DomainContextHandler()
     selection = ContextSetting([])
@@ -204,12 +440,61 @@ class OWInteractions(OWWidget, ConcurrentWidgetMixin):
     feature = ContextSetting(None)
     heuristic_mode: int
     heuristic_mode = Setting(0)
+    top_k: int
+    top_k = Setting(100)
+    execution_mode: int
+    execution_mode = Setting(Execution.SERIAL)
+    n_workers: int
+    n_workers = Setting(os.cpu_count() or 1)
+    approximate: bool
+    approximate = Setting(False)
+    sample_size: int
+    sample_size = Setting(10000)
+    triples: bool
+    triples = Setting(False)
+    per_target: bool
+    per_target = Setting(False)
+    measures: list
+    measures = Setting([])
+    output_matrix: bool
+    output_matrix = Setting(False)
+    on_disk: bool
+    on_disk = Setting(False)
+    keep_counts: bool
+    keep_counts = Setting(False)
+    use_cache: bool
+    use_cache = Setting(True)
+    cache_size: int
+    cache_size = Setting(1024)
+    significance: bool
+    significance = Setting(False)
+    n_significant: int
+    n_significant = Setting(1000)
+    n_permutations: int
+    n_permutations = Setting(100)
+
+    # location of cached results; their size is limited by `cache_size` (MB)
+    CACHE_DIR = os.path.join(cache_dir(), "interactions")
+    # minimal number of seconds between checkpoints of a running search
+    CHECKPOINT_INTERVAL = 60
+    # number of pairs tested for significance in one chunk
+    SIGNIFICANCE_CHUNK = 100
+    # measures that can be shown next to interactions
+    EXTRA_MEASURES = (Measure.SYMMETRIC_UNCERTAINTY, Measure.CONDITIONAL_MI,
+                      Measure.CHI_SQUARE)
 
     want_main_area = False
     want_control_area = True
 
     class Information(OWWidget.Information):
         removed_cons_feat = Msg("Constant features have been removed.")
+        pruned = Msg("{} pairs were skipped, since they cannot get "
+                     "into the top {}.")
+        resumed = Msg("Resumed an unfinished run with {} scored pairs.")
+        left_ignored = Msg("Left features do not split features of the "
+                           "data; all pairs are ranked.")
+        not_cached = Msg("Results take {} MB, more than the cache limit; "
+                         "they are not cached.")
 
     class Warning(OWWidget.Warning):
         not_enough_vars = Msg("At least two features are needed.")
@@ -225,16 +510,120 @@ class OWInteractions(OWWidget, ConcurrentWidgetMixin):
         self.progress = 0
 
         self.original_domain: Domain = ...
+        self.input_data: Table = None
         self.data: Table = ...
+        # discretized data, kept so that changes of settings do not
+        # discretize again
+        self.preparation = None
+        self.preparing = False
+        # None unless scores are refreshed after rows were appended;
+        # otherwise whether ranking continues and whether the button was
+        # enabled before
+        self.refreshing = None
+        # whether settings changed while refreshing; they are used after
+        self.changed_while_refreshing = False
+        self.spilled = False
         self.n_attrs = 0
 
         self.scorer = None
         self.heuristic = None
+        # features on the input and indices of those among attributes;
+        # if given, only pairs of a left and a right feature are ranked
+        self.left_features = None
+        self.left_index = None
+        # exact scores of pairs, kept across changes of mode and restarts
+        self.store = None
         self.feature_index = None
 
+        # scorer of a sample of rows and its scorer and size, constructed
+        # when approximating; see `get_sample_scorer`
+        self.sample_scorer = None
+        # states whose approximate scores are being replaced with exact ones
+        # and their rows in the model; None unless refining
+        self.refine_states = None
+        self.refine_rows = None
+        # triples of attributes ranked after pairs; None unless ranking them
+        self.triple_states = None
+        # top pairs whose p-values are being computed and their rows
+        # in the model; None unless testing significance
+        self.significance_states = None
+        self.significance_rows = None
+        # number of pairs skipped by top K pruning
+        self.n_pruned = 0
+        # settings and state at which a run stopped, loaded with the data;
+        # None unless there is an unfinished run to resume
+        self.checkpoint = None
+        self.last_checkpoint = 0
+        # counters of the current ranking, see `RunStats`
+        self.stats = RunStats()
+        # interactions of all pairs; None until computed after ranking
+        self.matrix = None
+
         gui.comboBox(self.controlArea, self, "heuristic_mode",
                      items=Heuristic.mode.values(),
                      callback=self.on_heuristic_combo_changed,)
+        self.top_k_spin = gui.spin(
+            self.controlArea, self, "top_k", 1, 1000000, label="Top K:",
+            callback=self.on_top_k_changed)
+        self.update_top_k_spin()
+        gui.checkBox(self.controlArea, self, "triples",
+                     "Rank triples of features from the top K pairs",
+                     callback=self.initialize)
+        gui.checkBox(self.controlArea, self, "per_target",
+                     "Score each target separately",
+                     callback=self.initialize)
+        self.measure_labels = [Measure.name[measure]
+                               for measure in self.EXTRA_MEASURES]
+        box = gui.hBox(self.controlArea)
+        gui.widgetLabel(box, "Also show:")
+        gui.listBox(box, self, "measures", labels="measure_labels",
+                    selectionMode=QListView.MultiSelection,
+                    callback=self.on_measures_changed)
+
+        box = gui.hBox(self.controlArea)
+        gui.checkBox(box, self, "approximate", "Approximate on a sample of",
+                     callback=self.on_approximate_changed)
+        gui.spin(box, self, "sample_size", 100, 100000000, step=100,
+                 callback=self.on_approximate_changed)
+        gui.widgetLabel(box, "rows")
+
+        box = gui.hBox(self.controlArea)
+        gui.checkBox(box, self, "significance", "Test significance of top",
+                     callback=self.initialize)
+        gui.spin(box, self, "n_significant", 1, 1000000,
+                 callback=self.on_significance_changed)
+        gui.widgetLabel(box, "pairs with")
+        gui.spin(box, self, "n_permutations", 10, 100000, step=10,
+                 callback=self.on_significance_changed)
+        gui.widgetLabel(box, "permutations")
+
+        box = gui.hBox(self.controlArea)
+        gui.comboBox(box, self, "execution_mode",
+                     items=Execution.mode.values())
+        gui.spin(box, self, "n_workers", 1, os.cpu_count() or 1,
+                 label="Workers:")
+        box = gui.hBox(self.controlArea)
+        gui.checkBox(box, self, "on_disk", "Keep discretized data on disk",
+                     callback=self.on_on_disk_changed)
+        gui.checkBox(box, self, "keep_counts",
+                     "Keep counts for appended rows",
+                     callback=self.on_keep_counts_changed)
+        box = gui.hBox(self.controlArea)
+        gui.checkBox(box, self, "use_cache",
+                     "Reuse results for the same data, up to")
+        gui.spin(box, self, "cache_size", 16, 1024 * 1024, step=256,
+                 callback=self.on_cache_size_changed)
+        gui.widgetLabel(box, "MB")
+        gui.checkBox(self.controlArea, self, "output_matrix",
+                     "Output interactions of all pairs as a matrix",
+                     callback=self.on_output_matrix_changed)
+        self.cache = ResultCache(self.CACHE_DIR, self.cache_size * 2 ** 20)
+        # checkpoints are removed once a run finishes; those of runs that
+        # never finish are evicted separately from results, within the same
+        # limit, and the one just written is kept
+        self.checkpoints = ResultCache(
+            os.path.join(self.CACHE_DIR, "checkpoints"),
+            self.cache_size * 2 ** 20)
 
         self.feature_model = DomainModel(order=DomainModel.ATTRIBUTES,
                                          separators=False,
@@ -262,6 +651,9 @@ class OWInteractions(OWWidget, ConcurrentWidgetMixin):
         view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         view.setItemDelegate(InteractionItemDelegate())
         view.setModel(self.proxy)
+        # views forget hidden columns when the model is reset
+        self.proxy.modelReset.connect(self.update_measure_columns)
+        self.proxy.columnsInserted.connect(self.update_measure_columns)
         view.selectionModel().selectionChanged.connect(self.on_selection_changed)
         self.controlArea.layout().addWidget(view)
 
@@ -270,50 +662,423 @@ class OWInteractions(OWWidget, ConcurrentWidgetMixin):
 
     @Inputs.data
     def set_data(self, data):
+        if self.rows_appended(data) and self.append_rows(data):
+            return
+        self.set_new_data(data)
+
+    def set_new_data(self, data):
+        """Discretize and rank `data` that do not extend the previous input."""
         self.closeContext()
         self.clear_messages()
         self.selection = {}
         self.original_domain = data and data.domain
+        self.input_data = data
         self.data = None
+        self.preparation = None
+        self.preparing = False
+        self.refreshing = None
+        self.scorer = self.store = None
+        self.clear_matrix()
+        self.spilled = False
         self.n_attrs = 0
+        self.sample_scorer = None
         if data is not None:
             if len(data) < 2:
                 self.Warning.not_enough_inst()
             elif data.Y.size == 0:
                 self.Warning.no_class_var()
             else:
-                remover = Remove(Remove.RemoveConstant)
-                data = Discretize()(remover(data))
-                if remover.attr_results["removed"]:
-                    self.Information.removed_cons_feat()
-                if len(data.domain.attributes) < 2:
-                    self.Warning.not_enough_vars()
-                else:
-                    self.data = data
-                    self.n_attrs = len(data.domain.attributes)
-                    self.scorer = InteractionScorer(data)
-                    self.heuristic = Heuristic(self.scorer.information_gain, self.heuristic_mode)
-                    self.model.set_domain(data.domain)
-                    self.proxy.scorer = self.scorer
-        self.feature_model.set_domain(self.data and self.data.domain)
+                self.start_preparation(data)
+                return
+        self.feature_model.set_domain(None)
         self.openContext(self.data)
         self.initialize()
 
+    def start_preparation(self, data, previous=None):
+        """
+        Discretize `data` (or reuse `previous` preparation) and construct
+        the scorer in the background; ranking starts when it is done.
+        """
+        self.keep_running = True
+        self.preparing = True
+        self.refreshing = None
+        self.model.clear()
+        self.button.setText("Start")
+        self.button.setEnabled(False)
+        self.start(prepare, data, self.on_disk, previous)
+
+    def set_preparation(self, preparation):
+        """Use data prepared for new input."""
+        self.preparation = preparation
+        if preparation.removed_constant:
+            self.Information.removed_cons_feat()
+        if len(preparation.data.domain.attributes) < 2:
+            self.Warning.not_enough_vars()
+        else:
+            self.data = preparation.data
+            self.spilled = preparation.spilled
+            self.n_attrs = len(self.data.domain.attributes)
+            self.set_scorer(preparation.scorer)
+            self.model.set_domain(self.data.domain)
+        self.feature_model.set_domain(self.data and self.data.domain)
+        self.openContext(self.data)
+
+    @Inputs.left_features
+    def set_left_features(self, features):
+        self.left_features = features
+        if self.data is not None:
+            self.update_left()
+            self.initialize()
+
+    def update_left(self):
+        """Find left features among attributes and order states accordingly."""
+        self.left_index = None
+        self.Information.left_ignored.clear()
+        if self.left_features:
+            names = {var.name for var in self.left_features}
+            index = np.array([i for i, var in enumerate(self.data.domain.attributes)
+                              if var.name in names], dtype=int)
+            if 0 < len(index) < self.n_attrs:
+                self.left_index = index
+            else:
+                self.Information.left_ignored()
+        self.heuristic = self.make_heuristic()
+
+    def make_heuristic(self, attributes=None):
+        return Heuristic(self.scorer.information_gain, self.heuristic_mode,
+                         attributes, self.left_index)
+
+    def partners(self):
+        """Return indices of attributes paired with the chosen feature."""
+        others = np.delete(np.arange(self.n_attrs), self.feature_index)
+        if self.left_index is None:
+            return others
+        is_left = np.isin(others, self.left_index)
+        if self.feature_index in self.left_index:
+            return others[~is_left]
+        return others[is_left]
+
+    def set_scorer(self, scorer):
+        self.scorer = scorer
+        self.scorer.keep_counts = self.keep_counts
+        self.update_left()
+        self.proxy.scorer = self.scorer
+        self.store = self.make_store(bool(self.measures))
+        self.sample_scorer = None
+        self.clear_matrix()
+        self.load_checkpoint()
+
+    def rows_appended(self, data):
+        """Tell whether `data` is the previous input with rows added."""
+        old = self.input_data
+        return data is not None and old is not None and self.data is not None \
+            and data.domain == old.domain and len(data) > len(old) \
+            and np.array_equal(data.X[:len(old)], old.X, equal_nan=True) \
+            and np.array_equal(data.Y[:len(old)], old.Y, equal_nan=True)
+
+    def append_rows(self, data):
+        """
+        Count the rows added to the input with the existing discretization
+        and refresh scores in the model in place, all in the background
+        (see `refresh`); ranking then continues if it was running. If new
+        rows have values that were not seen before, the data are prepared
+        anew once this is found.
+
+        Returns `False` if scores must be computed anew: when the data are
+        being prepared or scores refreshed, or when the ranking depends on
+        all scores (top K pruning, approximation, triples and p-values).
+        """
+        if self.preparing or self.refreshing is not None \
+                or self.pruning() or self.approximating() \
+                or self.triple_states is not None \
+                or self.significance_states is not None:
+            return False
+        # ranking, as opposed to computing the matrix of a finished run
+        running = self.task is not None and not self.keep_running \
+            and self.button.isEnabled()
+        self.refreshing = (running, self.button.isEnabled())
+        self.changed_while_refreshing = False
+        if running:
+            self.keep_running = True
+        self.button.setEnabled(False)
+        self.clear_matrix()
+        self.progressBarInit()
+        n_rows = len(self.model)
+        self.start(refresh, self.scorer, self.data, data, self.spilled,
+                   self.compute_scores, self.rows_for_states,
+                   self.model[:n_rows, -2:].astype(int) if n_rows
+                   else np.empty((0, 2), dtype=int),
+                   self.chunk_size())
+        return True
+
     def initialize(self):
+        if self.preparing:
+            # settings are used once the data are prepared
+            return
+        if self.refreshing is not None:
+            # the scorer changes in the task, which must not be interrupted
+            self.changed_while_refreshing = True
+            return
         if self.task is not None:
             self.keep_running = False
             self.cancel()
         self.keep_running = True
+        self.refreshing = None
         self.saved_state = None
         self.progress = 0
+        self.stats = RunStats()
+        self.refine_states = self.refine_rows = None
+        self.triple_states = None
+        self.significance_states = self.significance_rows = None
+        self.n_pruned = 0
         self.progressBarFinished()
+        self.Information.pruned.clear()
+        self.Information.resumed.clear()
         self.model.clear()
+        self.model.n_attr_columns = 2
+        if self.data is not None:
+            self.model.set_domain(self.data.domain)
+        labels = ["Interaction", "Information Gain", "Feature 1", "Feature 2"]
+        if self.approximating():
+            labels.insert(2, "±")
+        elif self.scoring_targets():
+            labels[2:2] = [f"Interaction ({var.name})"
+                           for var in self.data.domain.class_vars]
+        measures = [Measure.name[measure] for measure in self.extra_measures()]
+        labels[-2:-2] = measures
+        self.model.setHorizontalHeaderLabels(labels)
+        self.update_measure_columns()
         self.filter.setText("")
         self.button.setText("Start")
         self.button.setEnabled(self.data is not None)
-        if self.data is not None:
+        if self.data is not None and not self.load_cached():
+            self.load_stored()
+            self.resume()
             self.toggle()
 
+    def load_stored(self):
+        """
+        Put pairs of the current mode whose scores are already stored
+        into the model; only the remaining pairs are then scored.
+        """
+        if self.approximating() or self.scoring_targets() \
+                or not len(self.store):
+            return
+        if self.feature_index is None:
+            states = self.store.pairs(np.flatnonzero(self.store.computed))
+            if self.left_index is not None:
+                is_left = np.isin(states, self.left_index)
+                states = states[is_left[:, 0] != is_left[:, 1]]
+        else:
+            others = self.partners()
+            states = np.column_stack(
+                (np.full(len(others), self.feature_index), others))
+            states = states[self.store.get(states)[1]]
+        if len(states):
+            scores = self.store.get(states)[0].astype(float)
+            gains = self.scorer.normalize(self.scorer.information_gain)
+            measures = np.empty((len(states), 0))
+            if self.measuring():
+                indices = ScoreStore.index(states)
+                measures = self.store.measures[indices].astype(float)
+            self.model.extend(np.column_stack(
+                (scores, scores + gains[states[:, 0]] + gains[states[:, 1]],
+                 measures, states)))
+            self.progress = len(self.model)
+
+    def resume(self):
+        """Continue from the checkpoint, if it was made with the same settings."""
+        checkpoint, self.checkpoint = self.checkpoint, None
+        if checkpoint is None or self.approximating() \
+                or self.scoring_targets() \
+                or checkpoint[0] != self.checkpoint_position():
+            return
+        self.heuristic = self.make_heuristic(checkpoint[2])
+        self.saved_state = checkpoint[1]
+        self.Information.resumed(len(self.store))
+
+    def checkpoint_position(self):
+        """Return settings that determine the order of states."""
+        left = () if self.left_index is None else tuple(self.left_index.tolist())
+        return (self.heuristic_mode,
+                -1 if self.feature_index is None else self.feature_index) + left
+
+    def checkpoint_key(self):
+        """Return a key of the checkpoint of exact scores for the data."""
+        digest = blake2b(self.scorer.fingerprint().encode(), digest_size=16)
+        digest.update(b"checkpoint")
+        return digest.hexdigest()
+
+    def load_checkpoint(self):
+        """
+        Put exact scores from a checkpoint of an unfinished run into
+        the store, and keep the position for `resume`.
+        """
+        self.checkpoint = None
+        if not self.use_cache:
+            return
+        stored = self.checkpoints.get(self.checkpoint_key())
+        if stored is None:
+            return
+        try:
+            computed = np.unpackbits(stored["computed"],
+                                     count=len(self.store.computed))
+            computed = computed.astype(bool)
+            self.store.scores[computed] = stored["scores"]
+            if self.store.measures is not None:
+                self.store.measures[computed] = stored["measures"]
+            self.store.computed[:] = computed
+            self.checkpoint = (tuple(stored["position"].tolist()),
+                               tuple(stored["state"].tolist()) or None,
+                               stored["order"])
+        except (KeyError, IndexError, ValueError):
+            self.store = self.make_store(self.store.measures is not None)
+
+    def save_checkpoint(self):
+        """
+        Store exact scores computed so far, the order of the search of pairs
+        and the state at which it continues, compactly in the cache directory:
+        a bit for each pair telling whether it is computed, and float32 scores
+        of computed pairs. The cache writes the checkpoint in the background.
+        """
+        self.last_checkpoint = time.monotonic()
+        if not self.use_cache or self.store is None or not len(self.store):
+            return
+        state = ()
+        if self.saved_state is not None and self.triple_states is None \
+                and self.refine_states is None \
+                and self.significance_states is None \
+                and not self.approximating():
+            state = self.saved_state
+        measures = {}
+        if self.store.measures is not None:
+            measures["measures"] = self.store.measures[self.store.computed]
+        self.checkpoints.put(self.checkpoint_key(),
+                             computed=np.packbits(self.store.computed),
+                             scores=self.store.scores[self.store.computed],
+                             position=np.array(self.checkpoint_position()),
+                             order=self.heuristic.attributes,
+                             state=np.array(state, dtype=np.int64),
+                             **measures)
+
+    def remove_checkpoint(self):
+        if self.use_cache:
+            self.checkpoints.remove(self.checkpoint_key())
+
+    def cache_key(self):
+        """Return a key of results for the data and the current settings."""
+        significance = self.significance and \
+            (self.n_significant, self.n_permutations)
+        settings = (self.heuristic_mode, self.top_k, self.feature_index,
+                    self.approximating(), self.sample_size, self.triples,
+                    significance, self.scoring_targets(), self.measuring(),
+                    None if self.left_index is None else self.left_index.tolist())
+        digest = blake2b(self.scorer.fingerprint().encode(), digest_size=16)
+        digest.update(repr(settings).encode())
+        return digest.hexdigest()
+
+    def load_cached(self):
+        """
+        Fill the model with cached results, if any, and finish.
+        Returns `True` if results were found.
+        """
+        if not self.use_cache:
+            return False
+        cached = self.cache.get(self.cache_key())
+        if cached is None:
+            return False
+        try:
+            rows = self.cached_rows(cached)
+        except (KeyError, IndexError, ValueError):
+            return False
+        pruned = int(cached["pruned"])
+        if int(cached["n_attr_columns"]) == 3:
+            self.triple_states = []
+            self.model.n_attr_columns = 3
+            self.model.set_domain(self.data.domain, len(rows))
+        self.model.extend(rows)
+        labels = list(cached["labels"])
+        self.model.setHorizontalHeaderLabels(labels)
+        self.update_measure_columns()
+        if "p-value" in labels:
+            # rows were tested for significance; see `append_rows`
+            self.significance_states = []
+        if pruned:
+            self.Information.pruned(pruned, self.top_k)
+        self._finish()
+        return True
+
+    def cached_rows(self, cached):
+        """Return rows of the model from results stored by `store_cached`."""
+        scores = cached["scores"].astype(float)
+        if int(cached["n_attr_columns"]) == 3:
+            return np.column_stack((scores, cached["attrs"]))
+        states = ScoreStore.pairs(cached["indices"])
+        swapped = np.unpackbits(cached["swapped"],
+                                count=len(states)).astype(bool)
+        states[swapped] = states[swapped, ::-1]
+        gains = self.scorer.normalize(self.scorer.information_gain)
+        return np.column_stack(
+            (scores[:, 0],
+             scores[:, 0] + gains[states[:, 0]] + gains[states[:, 1]],
+             scores[:, 1:], states))
+
+    def store_cached(self):
+        """
+        Cache results compactly: scores as float32 and attributes of pairs as
+        their indices in the `ScoreStore`, with the order of attributes
+        of each pair in bits. Sums of information gains and interactions
+        are not stored. The cache writes results in the background.
+        """
+        self.Information.not_cached.clear()
+        if not self.use_cache or not len(self.model):
+            return
+        rows = self.model[:len(self.model)]
+        if self.model.n_attr_columns == 3:
+            attrs = rows[:, -3:]
+            arrays = dict(scores=rows[:, :-3].astype(np.float32),
+                          attrs=attrs.astype(code_dtype(self.n_attrs)))
+        else:
+            states = rows[:, -2:].astype(np.int64)
+            indices = ScoreStore.index(states)
+            arrays = dict(
+                scores=np.delete(rows[:, :-2], 1, axis=1).astype(np.float32),
+                indices=indices.astype(code_dtype(indices.max() + 1)),
+                swapped=np.packbits(states[:, 0] < states[:, 1]))
+        if not self.cache.put(self.cache_key(), pruned=self.n_pruned,
+                              n_attr_columns=self.model.n_attr_columns,
+                              labels=np.array(self.header_labels()),
+                              **arrays):
+            size = sum(array.nbytes for array in arrays.values())
+            self.Information.not_cached(-(-size // 2 ** 20))
+
+    def on_cache_size_changed(self):
+        self.cache.max_bytes = self.checkpoints.max_bytes = \
+            self.cache_size * 2 ** 20
+
+    def header_labels(self):
+        return [self.model.headerData(column, Qt.Horizontal)
+                for column in range(self.model.columnCount())]
+
+    def clear_matrix(self):
+        self.matrix = None
+        self.Outputs.matrix.send(None)
+
+    def on_output_matrix_changed(self):
+        if not self.output_matrix:
+            self.clear_matrix()
+        elif self.task is None:
+            self._start_matrix()
+
+    def _start_matrix(self):
+        """Compute the interaction matrix, unless it is or is being computed."""
+        if not self.output_matrix or self.matrix is not None \
+                or self.scorer is None or self.task is not None:
+            return
+        self.progressBarInit()
+        self.start(compute_matrix, self.data, self.scorer, self.store,
+                   self.on_disk)
+
     def commit(self):
         if self.original_domain is None:
             self.Outputs.features.send(None)
@@ -329,14 +1094,56 @@ class OWInteractions(OWWidget, ConcurrentWidgetMixin):
             self.button.repaint()
             self.filter.setEnabled(False)
             self.progressBarInit()
-            self.start(run, self.compute_score, self.row_for_state,
-                       self.iterate_states, self.saved_state,
-                       self.progress, self.state_count())
+            self.last_checkpoint = time.monotonic()
+            self.stats.start()
+            if self.significance_states is not None:
+                self.start(run, self.compute_p_values, self.rows_for_p_values,
+                           partial(self._iterate_from,
+                                   self.significance_states), self.progress,
+                           self.progress, len(self.significance_states),
+                           self.SIGNIFICANCE_CHUNK, None, None,
+                           stats=self.stats)
+            elif self.triple_states is not None:
+                self.start(run, self.compute_triple_scores,
+                           self.rows_for_triples,
+                           partial(self._iterate_from, self.triple_states),
+                           self.progress,
+                           self.progress, len(self.triple_states),
+                           self.chunk_size(), None, None, stats=self.stats)
+            elif self.refine_states is not None:
+                self.start(run, self.compute_scores,
+                           self.rows_for_sampled_states,
+                           partial(self._iterate_from, self.refine_states),
+                           self.progress,
+                           self.progress, len(self.refine_states),
+                           self.chunk_size(), self.make_pool(), None,
+                           stats=self.stats)
+            elif self.approximating():
+                self.start(run, self.compute_sampled_scores,
+                           self.rows_for_sampled_states,
+                           self.iterate_states, self.saved_state,
+                           self.progress, self.state_count(),
+                           self.chunk_size(), None, None, stats=self.stats)
+            elif self.feature is not None:
+                # all pairs with the feature are counted in a single pass
+                self.start(run, self.compute_feature_scores,
+                           self.rows_for_states, self.iterate_states,
+                           self.saved_state, self.progress,
+                           self.state_count(), self.state_count(), None, None,
+                           stats=self.stats)
+            else:
+                self.start(run, self.compute_scores, self.rows_for_states,
+                           self.iterate_states, self.saved_state,
+                           self.progress, self.state_count(),
+                           self.chunk_size(), self.make_pool(),
+                           self.make_top_k(), stats=self.stats)
         else:
             self.button.setText("Continue")
             self.button.repaint()
             self.filter.setEnabled(True)
             self.cancel()
+            self.stats.stop()
+            self.save_checkpoint()
             self._stopped()
 
     def _stopped(self):
@@ -349,9 +1156,11 @@ class OWInteractions(OWWidget, ConcurrentWidgetMixin):
             return
 
         if self.selection:
+            n_columns = self.model.columnCount()
+            n_attrs = self.model.n_attr_columns
             for i in range(n_rows):
-                names = {self.model.data(self.model.index(i, 2)),
-                         self.model.data(self.model.index(i, 3))}
+                names = {self.model.data(self.model.index(i, column))
+                         for column in range(n_columns - n_attrs, n_columns)}
                 if names == self.selection:
                     self.rank_table.selectRow(i)
                     break
@@ -360,7 +1169,8 @@ class OWInteractions(OWWidget, ConcurrentWidgetMixin):
             self.rank_table.selectRow(0)
 
     def on_selection_changed(self, selected):
-        self.selection = {self.model.data(ind) for ind in selected.indexes()[-2:]}
+        self.selection = {self.model.data(ind) for ind in
+                          selected.indexes()[-self.model.n_attr_columns:]}
         self.commit()
 
     def on_filter_changed(self, text):
@@ -370,64 +1180,467 @@ class OWInteractions(OWWidget, ConcurrentWidgetMixin):
         self.feature_index = self.feature and self.data.domain.index(self.feature)
         self.initialize()
 
+    def update_top_k_spin(self):
+        self.top_k_spin.setEnabled(self.heuristic_mode == Heuristic.TOP_K
+                                   or self.approximate or self.triples)
+
     def on_heuristic_combo_changed(self):
+        self.update_top_k_spin()
         if self.data is not None:
-            self.heuristic = Heuristic(self.scorer.information_gain, self.heuristic_mode)
+            self.heuristic = self.make_heuristic()
         self.initialize()
 
-    def compute_score(self, state):
-        attr1, attr2 = state
-        scores = (self.scorer(attr1, attr2),
-                  self.scorer.information_gain[attr1],
-                  self.scorer.information_gain[attr2])
-        return tuple(self.scorer.normalize(score) for score in scores)
+    def on_top_k_changed(self):
+        if self.heuristic_mode == Heuristic.TOP_K or self.approximating() \
+                or self.triples:
+            self.initialize()
+
+    def on_significance_changed(self):
+        if self.significance:
+            self.initialize()
+
+    def on_approximate_changed(self):
+        self.update_top_k_spin()
+        self.sample_scorer = None
+        self.initialize()
+
+    def on_on_disk_changed(self):
+        if self.data is not None:
+            self.start_preparation(self.input_data, self.preparation)
+
+    def on_keep_counts_changed(self):
+        if self.scorer is not None:
+            self.scorer.keep_counts = self.keep_counts
+            if not self.keep_counts:
+                self.scorer.release_counts()
+
+    def approximating(self):
+        """
+        Tell whether pairs are first scored on a sample, which only
+        happens if the sample is smaller than the data.
+        """
+        return self.approximate and self.scorer is not None \
+            and self.data is not None and self.sample_size < len(self.data)
+
+    def scoring_targets(self):
+        """
+        Tell whether pairs are also scored with each target of a multi-target
+        class; scores of all targets are computed in a single pass.
+        """
+        return self.per_target and self.data is not None \
+            and len(self.data.domain.class_vars) > 1 \
+            and self.scorer.backend == InteractionScorer.BINCOUNT \
+            and not self.approximating()
+
+    def measuring(self):
+        """
+        Tell whether pairs are scored with all `EXTRA_MEASURES`, which
+        are kept in the store. Once a measure is chosen, measures are
+        computed for the data from then on, and choosing measures only
+        shows or hides their columns.
+        """
+        return self.store is not None and self.store.measures is not None \
+            and not self.approximating()
+
+    def extra_measures(self):
+        """Return measures in columns after interactions."""
+        return list(self.EXTRA_MEASURES) if self.measuring() else []
+
+    def extra_columns(self):
+        """
+        Tell whether rows have scores after interactions and information
+        gains, which pools do not compute.
+        """
+        return self.scoring_targets() or self.measuring()
+
+    def make_store(self, measures=False):
+        return ScoreStore(self.n_attrs,
+                          len(self.EXTRA_MEASURES) if measures else 0)
+
+    def put_stored(self, rows):
+        """Store exact scores of pairs, and their measures, from `rows`."""
+        if self.store.measures is not None and not self.measuring():
+            # rows of approximation have no measures
+            return
+        n_measures = len(self.extra_measures())
+        self.store.put(rows[:, -2:], rows[:, 0],
+                       rows[:, -2 - n_measures:-2] if n_measures else None)
+
+    def on_measures_changed(self):
+        if self.measures and self.store is not None \
+                and self.store.measures is None:
+            # stored pairs are scored again, with measures
+            self.store = self.make_store(True)
+            self.initialize()
+        else:
+            self.update_measure_columns()
+
+    def update_measure_columns(self):
+        """Show columns of chosen measures and hide the others."""
+        shown = {Measure.name[self.EXTRA_MEASURES[i]] for i in self.measures}
+        names = set(self.measure_labels)
+        for column in range(self.model.columnCount()):
+            label = self.model.headerData(column, Qt.Horizontal)
+            self.rank_table.setColumnHidden(
+                column, label in names and label not in shown)
+
+    def make_top_k(self):
+        """
+        Return the top K pruning for `run`, with scores already in the model,
+        or `None` when all pairs are scored.
+        """
+        if not self.pruning():
+            return None
+        scores = self.model[:len(self.model), 0] if len(self.model) else ()
+        return TopK(self.top_k, self.bound, scores)
+
+    def pruning(self):
+        """Tell whether pairs that cannot get into the top K are skipped."""
+        return self.heuristic_mode == Heuristic.TOP_K \
+            and self.feature is None and not self.approximating()
+
+    def bound(self, states):
+        return self.scorer.normalize(self.scorer.upper_bound(states))
+
+    def chunk_size(self):
+        if self.pruning():
+            # small chunks, so the search stops soon after the bound is hit
+            return min(self.scorer.block_size, max(self.top_k, 64))
+        return self.scorer.block_size
+
+    def make_pool(self):
+        """
+        Return a factory for the pool used by `run`, or `None` to score
+        in the task's thread. The pool is created and shut down by `run`.
+        """
+        if self.extra_columns():
+            # pools only compute interactions with the class
+            return None
+        if self.execution_mode == Execution.PROCESSES \
+                and self.scorer.backend == InteractionScorer.BINCOUNT:
+            if self.scorer.on_disk:
+                # processes would copy codes kept on disk into shared memory
+                return partial(ThreadPoolScorer, self.scorer, self.n_workers)
+            return partial(ProcessPoolScorer, self.scorer, self.n_workers)
+        if self.execution_mode == Execution.THREADS:
+            return partial(ThreadPoolScorer, self.scorer, self.n_workers)
+        return None
+
+    def compute_scores(self, states):
+        measures = self.extra_measures()
+        if self.scoring_targets():
+            scores = self.compute_target_scores(states)
+            if measures:
+                scores = np.column_stack(
+                    (scores, self.scorer.normalized_measures(states, measures)))
+            return scores
+        if measures:
+            # interactions are computed from the same counts as measures
+            pairs = np.array(states, dtype=int).reshape(-1, 2)
+            scores = self.scorer.normalized_measures(
+                pairs, [Measure.INTERACTION] + measures)
+            gains = self.scorer.normalize(self.scorer.information_gain)
+            return np.column_stack((scores[:, 0], gains[pairs[:, 0]],
+                                    gains[pairs[:, 1]], scores[:, 1:]))
+        return self.scorer.normalized_scores(states)
+
+    def compute_target_scores(self, states):
+        """
+        Return normalized scores as `normalized_scores`, followed by
+        interactions with each target, normalized by its entropy.
+        """
+        pairs = np.array(states, dtype=int).reshape(-1, 2)
+        scores = self.scorer.score_targets(pairs)
+        gains = self.scorer.information_gain
+        entropies, _ = self.scorer.target_gains()
+        return np.column_stack((
+            self.scorer.normalize(np.column_stack(
+                (scores[:, 0], gains[pairs[:, 0]], gains[pairs[:, 1]]))),
+            scores[:, 1:] / np.where(entropies > 0, entropies, 1)))
+
+    def compute_feature_scores(self, states):
+        if self.extra_columns():
+            return self.compute_scores(states)
+        pairs = np.array(states, dtype=int).reshape(-1, 2)
+        gains = self.scorer.information_gain
+        scores = self.scorer.score_feature(self.feature_index, pairs[:, 1])
+        return self.scorer.normalize(np.column_stack(
+            (scores, gains[pairs[:, 0]], gains[pairs[:, 1]])))
+
+    def get_sample_scorer(self):
+        """
+        Return the scorer of a sample of rows. It is constructed on first
+        use, in the task's thread, and kept for the same scorer and size.
+        """
+        key = self.scorer, self.sample_size
+        if self.sample_scorer is None or self.sample_scorer[0] != key:
+            self.sample_scorer = key, SampleScorer(*key)
+        return self.sample_scorer[1]
+
+    def compute_sampled_scores(self, states):
+        pairs = np.array(states, dtype=int).reshape(-1, 2)
+        scores, half_widths = self.get_sample_scorer().score_pairs(pairs)
+        gains = self.scorer.information_gain
+        return self.scorer.normalize(np.column_stack(
+            (scores, gains[pairs[:, 0]], gains[pairs[:, 1]], half_widths)))
+
+    def compute_triple_scores(self, states):
+        scores = self.scorer.score_triples(states)
+        return self.scorer.normalize(scores)[:, None]
+
+    @staticmethod
+    def rows_for_states(scores, states):
+        # scores with separate targets and other measures, if any,
+        # follow the first three
+        scores = np.asarray(scores, dtype=float)
+        return np.column_stack((scores[:, 0], scores[:, :3].sum(axis=1),
+                                scores[:, 3:], states))
+
+    @staticmethod
+    def rows_for_sampled_states(scores, states):
+        scores = np.asarray(scores, dtype=float)
+        # exact scores have no fourth column and a zero-width interval
+        half_widths = scores[:, 3] if scores.shape[1] > 3 \
+            else np.zeros(len(scores))
+        return np.column_stack((scores[:, 0], scores[:, :3].sum(axis=1),
+                                half_widths, states))
+
+    def compute_p_values(self, states):
+        return self.scorer.permutation_p_values(states, self.n_permutations)
 
     @staticmethod
-    def row_for_state(score, state):
-        return [score[0], sum(score)] + list(state)
+    def rows_for_p_values(p_values, states):
+        return np.column_stack((p_values, states))
+
+    @staticmethod
+    def rows_for_triples(scores, states):
+        return np.column_stack((np.asarray(scores, dtype=float)[:, 0], states))
 
     def iterate_states(self, initial_state):
+        states = self._iterate_states(initial_state)
+        if self.approximating() or self.scoring_targets() \
+                or self.store is None:
+            return states
+        # stored scores were put into the model by `load_stored`
+        return (state for state in states if not self.store.is_computed(state))
+
+    def _iterate_states(self, initial_state):
         if self.feature is not None:
             return self._iterate_by_feature(initial_state)
-        if self.n_attrs > 3 and self.heuristic is not None:
+        if self.heuristic is not None and (
+                self.n_attrs > 3 or self.heuristic_mode == Heuristic.TOP_K
+                or self.left_index is not None):
             return self.heuristic.get_states(initial_state)
         return self._iterate_all(initial_state)
 
     def _iterate_all(self, initial_state):
-        i0, j0 = initial_state or (0, 0)
-        for i in range(i0, self.n_attrs):
-            for j in range(j0, i):
-                yield i, j
-            j0 = 0
+        # pairs (i, j), j < i, in order of their index in the score store
+        start = 0 if initial_state is None \
+            else int(ScoreStore.index(initial_state)[0])
+        n_states = self.n_attrs * (self.n_attrs - 1) // 2
+        for first in range(start, n_states, Heuristic.BLOCK):
+            indices = np.arange(first, min(first + Heuristic.BLOCK, n_states))
+            yield from map(tuple, ScoreStore.pairs(indices).tolist())
+
+    @staticmethod
+    def _iterate_from(states, offset):
+        # stages over a list of states resume at the number of scored
+        # states, `progress`, instead of searching for the saved state
+        return iter(states[offset:])
 
     def _iterate_by_feature(self, initial_state):
         _, j0 = initial_state or (0, 0)
-        for j in range(j0, self.n_attrs):
-            if j != self.feature_index:
-                yield self.feature_index, j
+        for j in self.partners():
+            if j >= j0:
+                yield self.feature_index, int(j)
 
     def state_count(self):
-        if self.feature_index is None:
-            return self.n_attrs * (self.n_attrs - 1) // 2
-        return self.n_attrs - 1
+        if self.feature_index is not None:
+            return len(self.partners())
+        if self.left_index is not None:
+            return len(self.left_index) * (self.n_attrs - len(self.left_index))
+        return self.n_attrs * (self.n_attrs - 1) // 2
 
     def on_partial_result(self, result):
-        add_to_model, latest_state = result
-        if add_to_model:
-            self.saved_state = latest_state
-            self.model.extend(add_to_model)
+        rows, latest_state = result
+        if not len(rows):
+            return
+        self.saved_state = latest_state
+        start, sort_time = time.perf_counter(), self.model.sort_time
+        if self.significance_states is not None:
+            self.model.set_column(
+                [self.significance_rows[tuple(map(int, row[-2:]))]
+                 for row in rows], self.p_column(), rows[:, 0])
+            self.progress += len(rows)
+            count = len(self.significance_states)
+        elif self.refine_states is not None:
+            self.model.update([self.refine_rows[tuple(map(int, row[-2:]))]
+                               for row in rows], rows)
+            self.put_stored(rows)
+            self.progress += len(rows)
+            count = len(self.refine_states)
+        else:
+            self.model.extend(rows)
+            if self.triple_states is None and not self.approximating():
+                self.put_stored(rows)
             self.progress = len(self.model)
-            self.progressBarSet(self.progress * 100 // self.state_count())
+            count = self.state_count() if self.triple_states is None \
+                else len(self.triple_states)
+        sort_time = self.model.sort_time - sort_time
+        self.stats.sort += sort_time
+        self.stats.model += time.perf_counter() - start - sort_time
+        self.progressBarSet(self.progress * 100 // count)
+        self.setStatusMessage(self.stats.status(count - self.progress))
+        if time.monotonic() - self.last_checkpoint >= self.CHECKPOINT_INTERVAL:
+            self.save_checkpoint()
+
+    def _start_refinement(self):
+        """
+        Select pairs whose confidence intervals overlap with the top K
+        and start replacing their approximate scores with exact ones,
+        from the highest upper limits down.
+        """
+        data = self.model[:len(self.model)]
+        scores, half_widths = data[:, 0], data[:, 2]
+        k = min(self.top_k, len(data))
+        threshold = np.partition(scores - half_widths, -k)[-k]
+        upper = scores + half_widths
+        rows = np.flatnonzero(upper >= threshold)
+        rows = rows[np.argsort(-upper[rows], kind="stable")]
+        self.refine_states = [tuple(map(int, data[row, -2:])) for row in rows]
+        self.refine_rows = dict(zip(self.refine_states, rows))
+        self.saved_state = None
+        self.progress = 0
+        self.keep_running = True
+        self.toggle()
+
+    def p_column(self):
+        return self.model.columnCount() - self.model.n_attr_columns - 1
+
+    def _start_significance(self):
+        """
+        Add a column of p-values of the top pairs, computed by permutation
+        tests from the highest interactions down.
+        """
+        data = self.model[:len(self.model)]
+        k = min(self.n_significant, len(data))
+        rows = np.argsort(-data[:, 0], kind="stable")[:k]
+        self.significance_states = [tuple(map(int, data[row, -2:]))
+                                    for row in rows]
+        self.significance_rows = dict(zip(self.significance_states, rows))
+        labels = self.header_labels()
+        column = len(labels) - self.model.n_attr_columns
+        self.model.insert_column(column)
+        self.model.setHorizontalHeaderLabels(
+            labels[:column] + ["p-value"] + labels[column:])
+        self.saved_state = None
+        self.progress = 0
+        self.keep_running = True
+        self.toggle()
+
+    def _start_triples(self):
+        """
+        Rank triples that extend the top K pairs with any other attribute.
+        Triples of the best pairs are scored first.
+        """
+        data = self.model[:len(self.model)]
+        k = min(self.top_k, len(data))
+        top = data[np.argsort(-data[:, 0], kind="stable")[:k], -2:].astype(int)
+        triples = (tuple(sorted((a, b, c)))
+                   for a, b in top for c in range(self.n_attrs)
+                   if c != a and c != b)
+        self.triple_states = list(dict.fromkeys(triples))
+        self.model.clear()
+        self.model.n_attr_columns = 3
+        self.model.set_domain(self.data.domain, len(self.triple_states))
+        self.model.setHorizontalHeaderLabels(
+            ["Interaction", "Feature 1", "Feature 2", "Feature 3"])
+        self.saved_state = None
+        self.progress = 0
+        self.keep_running = True
+        self.toggle()
 
     def on_done(self, result):
+        # new tasks cannot be started from `on_done`
+        self.stats.stop()
+        if isinstance(result, Preparation):
+            self.preparing = False
+            if self.data is None:
+                self.set_preparation(result)
+            else:
+                self.preparation = result
+                self.data = result.data
+                self.spilled = result.spilled
+                self.set_scorer(result.scorer)
+            QTimer.singleShot(0, self.initialize)
+            return
+        if isinstance(result, Refresh):
+            (running, enabled), self.refreshing = self.refreshing, None
+            self.progressBarFinished()
+            if result.data is None:
+                # new rows have values that were not seen before
+                QTimer.singleShot(
+                    0, partial(self.set_new_data, result.input_data))
+                return
+            self.input_data = result.input_data
+            self.data = self.preparation.data = result.data
+            self.store = self.make_store(self.measuring())
+            self.button.setEnabled(running or enabled)
+            if self.changed_while_refreshing:
+                QTimer.singleShot(0, self.initialize)
+                return
+            if result.rows is not None:
+                self.model.update(np.arange(len(result.rows)), result.rows)
+                self.put_stored(result.rows)
+            if running:
+                QTimer.singleShot(0, self.toggle)
+            else:
+                QTimer.singleShot(0, self._start_matrix)
+            return
+        if isinstance(result, DistMatrix):
+            self.progressBarFinished()
+            if self.output_matrix:
+                self.matrix = result
+                self.Outputs.matrix.send(result)
+            return
+        if self.triple_states is None and self.significance_states is None:
+            if self.refine_states is None and self.approximating() \
+                    and len(self.model):
+                QTimer.singleShot(0, self._start_refinement)
+                return
+            if self.pruning():
+                self.n_pruned = self.state_count() - len(self.model)
+                if self.n_pruned:
+                    self.Information.pruned(self.n_pruned, self.top_k)
+            if self.triples and self.feature is None and self.n_attrs > 2 \
+                    and len(self.model):
+                QTimer.singleShot(0, self._start_triples)
+                return
+            if self.significance and len(self.model):
+                QTimer.singleShot(0, self._start_significance)
+                return
+        self.store_cached()
+        self.remove_checkpoint()
+        self._finish()
+
+    def _finish(self):
         self.button.setText("Finished")
         self.button.setEnabled(False)
         self.filter.setEnabled(True)
         self.keep_running = False
         self.saved_state = None
         self._stopped()
+        QTimer.singleShot(0, self._start_matrix)
+
+    def onDeleteWidget(self):
+        if self.task is not None:
+            self.save_checkpoint()
+        self.shutdown()
+        super().onDeleteWidget()
 
     def send_report(self):
+        if self.stats.n_scored:
+            self.report_items("Performance", self.stats.report_items())
         self.report_table("Interactions", self.rank_table)
 
 
@@ -1,18 +1,29 @@
+import csv
+import os
+import subprocess
+import sys
+import threading
 import unittest
-from unittest.mock import Mock
+from tempfile import TemporaryFile, TemporaryDirectory
+from functools import partial
+from itertools import combinations
+from unittest.mock import Mock, patch
 
 import numpy as np
 import numpy.testing as npt
 
-from AnyQt.QtCore import QItemSelection
+from AnyQt.QtCore import QItemSelection, Qt
 
 from Orange.data import Table, Domain, ContinuousVariable, DiscreteVariable
-from Orange.widgets.tests.base import WidgetTest
+from Orange.widgets.tests.base import WidgetTest, DEFAULT_TIMEOUT
 from Orange.widgets.tests.utils import simulate
 from Orange.widgets.widget import AttributeList
 
-from orangecontrib.prototypes.widgets.owinteractions import OWInteractions, Heuristic
-from orangecontrib.prototypes.interactions import InteractionScorer
+from orangecontrib.prototypes.widgets.owinteractions import OWInteractions, Heuristic, \
+    Execution, RunStats, run, prepare
+from orangecontrib.prototypes.interactions import InteractionScorer, Measure, \
+    SampleScorer, ScoreStore, TopK, distribution, entropy, hash_rows, rank_interactions, \
+    interaction_matrix, ProcessPoolScorer, ThreadPoolScorer
 
 
 class TestOWInteractions(WidgetTest):
@@ -23,7 +34,17 @@ class TestOWInteractions(WidgetTest):
         cls.zoo = Table("zoo")  # discrete data
 
     def setUp(self):
-        self.widget = self.create_widget(OWInteractions)
+        self.widget = self.create_widget(OWInteractions,
+                                         stored_settings={"use_cache": False})
+
+    def wait_until_finished(self, widget=None, timeout=DEFAULT_TIMEOUT):
+        """Wait for preparation of data and the stages of ranking that follow"""
+        widget = widget or self.widget
+        super().wait_until_finished(widget, timeout)
+        self.process_events()
+        while widget.task is not None:
+            super().wait_until_finished(widget, timeout)
+            self.process_events()
 
     def test_input_data(self):
         """Check table on input data"""
@@ -150,14 +171,136 @@ class TestOWInteractions(WidgetTest):
         sel_row = w.rank_table.selectionModel().selectedRows()[0].row()
         self.assertEqual(sel_row, 2)
 
+    def test_prepare(self):
+        """Check that data are discretized in a cancellable stage"""
+        task = Mock()
+        task.is_interruption_requested.return_value = False
+        preparation = prepare(self.iris, False, None, task)
+        self.assertEqual(len(preparation.data.domain.attributes), 4)
+        self.assertTrue(all(var.is_discrete
+                            for var in preparation.data.domain.attributes))
+        self.assertIsNotNone(preparation.scorer)
+        self.assertGreater(task.set_progress_value.call_count, 4)
+
+        preparation = prepare(self.iris, True, preparation, task)
+        self.assertTrue(preparation.spilled)
+        self.assertTrue(preparation.scorer.on_disk)
+
+        task.is_interruption_requested.return_value = True
+        self.assertIsNone(prepare(self.iris, False, None, task))
+
+    def test_prepare_in_background(self):
+        """Check that settings changed during preparation are used after it"""
+        self.send_signal(self.widget.Inputs.data, self.zoo)
+        self.assertTrue(self.widget.preparing)
+        self.assertIsNone(self.widget.data)
+        simulate.combobox_activate_index(
+            self.widget.controls.heuristic_mode, Heuristic.INFO_GAIN)
+        self.assertTrue(self.widget.preparing)
+        self.wait_until_finished()
+        self.assertFalse(self.widget.preparing)
+        self.assertEqual(self.widget.heuristic.heuristic_mode, Heuristic.INFO_GAIN)
+        self.assertEqual(self.widget.model.rowCount(), 120)
+
+    def test_fingerprint_in_background(self):
+        """Check that the digest of data is computed in tasks"""
+        threads = []
+        fingerprint = InteractionScorer.fingerprint
+
+        def record_thread(scorer):
+            if scorer._fingerprint is None:
+                threads.append(threading.current_thread())
+            return fingerprint(scorer)
+
+        with TemporaryDirectory() as cache_dir, \
+                patch.object(OWInteractions, "CACHE_DIR", cache_dir), \
+                patch.object(InteractionScorer, "fingerprint", record_thread):
+            widget = self.create_widget(OWInteractions)
+            self.send_signal(widget.Inputs.data, self.zoo[:80], widget=widget)
+            self.wait_until_finished(widget=widget)
+            self.send_signal(widget.Inputs.data, self.zoo, widget=widget)
+            self.wait_until_finished(widget=widget)
+            widget.save_checkpoint()
+            widget.cache.flush()
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.main_thread(), threads)
+
+    def test_stats(self):
+        """Check counters of throughput"""
+        self.send_signal(self.widget.Inputs.data, self.zoo)
+        self.wait_until_finished()
+        stats = self.widget.stats
+        self.assertEqual(stats.n_scored, 120)
+        summary = stats.summary()
+        self.assertEqual(summary["scored"], 120)
+        for key in ("elapsed", "per_second", "scoring", "queue", "model", "sort"):
+            self.assertGreaterEqual(summary[key], 0)
+        self.assertGreater(summary["per_second"], 0)
+        elapsed = stats.elapsed
+        self.assertEqual(stats.elapsed, elapsed)  # stopped when finished
+
+        self.assertEqual(stats.eta(0), 0)
+        self.assertIn("ETA 0:00:00", stats.status(0))
+        self.assertIsNone(RunStats().eta(10))
+        self.assertIn("ETA ?", RunStats().status(10))
+
+        self.widget.send_report()
+
+    def test_left_features(self):
+        """Check that pairs of left and other features are ranked"""
+        attributes = self.zoo.domain.attributes
+        self.send_signal(self.widget.Inputs.data, self.zoo)
+        self.wait_until_finished()
+        expected = {tuple(sorted(row[-2:])): row[0]
+                    for row in self.widget.model[:len(self.widget.model)]}
+
+        self.send_signal(self.widget.Inputs.left_features,
+                         AttributeList(attributes[:2]))
+        self.wait_until_finished()
+        self.assertEqual(self.widget.state_count(), 2 * 14)
+        rows = self.widget.model[:len(self.widget.model)]
+        self.assertEqual(len(rows), 2 * 14)
+        for row in rows:
+            self.assertEqual(sum(index < 2 for index in row[-2:]), 1)
+            self.assertAlmostEqual(row[0], expected[tuple(sorted(row[-2:]))], 6)
+
+        self.widget.store = ScoreStore(self.widget.n_attrs)
+        simulate.combobox_activate_index(
+            self.widget.controls.heuristic_mode, Heuristic.TOP_K)
+        self.wait_until_finished()
+        rows = self.widget.model[:len(self.widget.model)]
+        self.assertLessEqual(len(rows), 2 * 14)
+        best = sorted((score for pair, score in expected.items()
+                       if sum(index < 2 for index in pair) == 1), reverse=True)
+        npt.assert_almost_equal(np.sort(rows[:, 0])[::-1][:self.widget.top_k],
+                                best[:self.widget.top_k], 6)
+
+        simulate.combobox_activate_index(self.widget.controls.feature, 1)
+        self.wait_until_finished()
+        self.assertEqual(len(self.widget.model), 14)
+        simulate.combobox_activate_index(self.widget.controls.feature, 5)
+        self.wait_until_finished()
+        self.assertEqual(len(self.widget.model), 2)
+
+        simulate.combobox_activate_index(self.widget.controls.feature, 0)
+        self.send_signal(self.widget.Inputs.left_features,
+                         AttributeList(self.iris.domain.attributes))
+        self.wait_until_finished()
+        self.assertTrue(self.widget.Information.left_ignored.is_shown())
+        self.assertEqual(len(self.widget.model), 120)
+
+        self.send_signal(self.widget.Inputs.left_features, None)
+        self.assertFalse(self.widget.Information.left_ignored.is_shown())
+
     def test_feature_combo(self):
         """Check feature combobox"""
         feature_combo = self.widget.controls.feature
         self.send_signal(self.widget.Inputs.data, self.iris)
+        self.wait_until_finished()
         self.assertEqual(len(feature_combo.model()), 5)
 
-        self.wait_until_stop_blocking()
         self.send_signal(self.widget.Inputs.data, self.zoo)
+        self.wait_until_finished()
         self.assertEqual(len(feature_combo.model()), 17)
 
     def test_select_feature(self):
@@ -200,15 +343,636 @@ class TestOWInteractions(WidgetTest):
 
     def test_compute_score(self):
         self.widget.scorer = InteractionScorer(self.zoo)
-        npt.assert_almost_equal(self.widget.compute_score((1, 0)),
-                                [-0.0771,  0.3003,  0.3307], 4)
+        npt.assert_almost_equal(self.widget.compute_scores([(1, 0)]),
+                                [[-0.0771,  0.3003,  0.3307]], 4)
+
+    def test_compute_scores(self):
+        self.widget.scorer = InteractionScorer(self.zoo)
+        scores = self.widget.compute_scores([(1, 0), (3, 2)])
+        self.assertEqual(scores.shape, (2, 3))
+        npt.assert_almost_equal(scores[0], self.widget.compute_scores([(1, 0)])[0])
+        npt.assert_almost_equal(scores[1], self.widget.compute_scores([(3, 2)])[0])
+
+    def test_chunks(self):
+        """Check that all states are scored when split into chunks"""
+        with patch.object(InteractionScorer, "MAX_KEYS", 7 * len(self.zoo)):
+            self.send_signal(self.widget.Inputs.data, self.zoo)
+            self.wait_until_finished()
+            self.process_events()
+        self.assertEqual(self.widget.model.rowCount(), 120)
+        pairs = {tuple(sorted(row[2:])) for row in self.widget.model}
+        self.assertEqual(len(pairs), 120)
+
+    def test_pools(self):
+        """Check scoring with pools of processes and threads"""
+        self.send_signal(self.widget.Inputs.data, self.zoo)
+        self.wait_until_finished()
+        expected = {tuple(sorted(row[2:])): row[0] for row in self.widget.model}
+
+        self.widget.n_workers = 2
+        for mode in (Execution.PROCESSES, Execution.THREADS):
+            self.widget.execution_mode = mode
+            with patch.object(InteractionScorer, "MAX_KEYS", 7 * len(self.zoo)):
+                self.send_signal(self.widget.Inputs.data, self.zoo)
+                self.wait_until_finished(timeout=20000)
+            self.process_events()
+            self.assertEqual(self.widget.model.rowCount(), 120)
+            for row in self.widget.model:
+                self.assertAlmostEqual(row[0], expected[tuple(sorted(row[2:]))])
+
+    def test_pools_on_disk(self):
+        """Check that codes kept on disk are scored by threads"""
+        self.send_signal(self.widget.Inputs.data, self.zoo)
+        self.wait_until_finished()
+        self.widget.controls.on_disk.setChecked(True)
+        self.wait_until_finished()
+        self.widget.execution_mode = Execution.PROCESSES
+        self.assertIs(self.widget.make_pool().func, ThreadPoolScorer)
+        self.widget.controls.on_disk.setChecked(False)
+        self.wait_until_finished()
+        self.assertIs(self.widget.make_pool().func, ProcessPoolScorer)
+
+    def test_top_k(self):
+        """Check that pruning finds the same top pairs as a full search"""
+        # class is xor of the first two attributes, others are noisy copies
+        rng = np.random.default_rng(0)
+        x = rng.integers(0, 2, (200, 22))
+        y = x[:, 0] ^ x[:, 1]
+        x[:, 2:] = y[:, None] ^ (rng.random((200, 20)) < 0.1)
+        domain = Domain([DiscreteVariable(f"a{i}", ["0", "1"]) for i in range(22)],
+                        DiscreteVariable("y", ["0", "1"]))
+        data = Table(domain, x, y)
+
+        scorer = InteractionScorer(data)
+        expected = np.sort(scorer.normalize(scorer.score_pairs(
+            [(i, j) for i in range(22) for j in range(i)])))[-5:]
+
+        self.widget.top_k = 5
+        self.widget.heuristic_mode = Heuristic.TOP_K
+        self.send_signal(self.widget.Inputs.data, data)
+        self.wait_until_finished()
+        self.process_events()
+        scores = [row[0] for row in self.widget.model[:len(self.widget.model)]]
+        self.assertLess(len(scores), 231)
+        npt.assert_almost_equal(np.sort(scores)[-5:], expected)
+        self.assertTrue(self.widget.Information.pruned.is_shown())
+
+        simulate.combobox_activate_index(
+            self.widget.controls.heuristic_mode, Heuristic.INFO_GAIN)
+        self.wait_until_finished()
+        self.assertEqual(len(self.widget.model), 231)
+        self.assertFalse(self.widget.Information.pruned.is_shown())
+
+    def test_approximate(self):
+        """Check that top scores are refined after scoring a sample"""
+        scorer = InteractionScorer(self.zoo)
+        self.widget.approximate = True
+        self.widget.sample_size = 50
+        self.widget.top_k = 5
+        threads = []
+
+        def sample_scorer(*args):
+            threads.append(threading.current_thread())
+            return SampleScorer(*args)
+
+        with patch("orangecontrib.prototypes.widgets.owinteractions."
+                   "SampleScorer", sample_scorer):
+            self.send_signal(self.widget.Inputs.data, self.zoo)
+            self.wait_until_finished()
+        # the sample is drawn in the task
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
+        self.process_events()
+        self.assertIsNotNone(self.widget.refine_states)
+        self.wait_until_finished()
+        self.process_events()
+        self.assertEqual(self.widget.model.columnCount(), 5)
+        self.assertEqual(self.widget.model.rowCount(), 120)
+        self.assertEqual(self.widget.button.text(), "Finished")
+
+        data = self.widget.model[:len(self.widget.model)]
+        refined = data[:, 2] == 0
+        self.assertGreaterEqual(refined.sum(), 5)
+        self.assertLess(refined.sum(), 120)
+        exact = scorer.normalize(scorer.score_pairs(data[refined, -2:]))
+        npt.assert_almost_equal(data[refined, 0], exact)
+        # top rows are refined
+        top = self.widget.model.mapToSourceRows(np.arange(5))
+        self.assertTrue(np.all(data[top, 2] == 0))
+
+    def test_triples(self):
+        """Check that triples are ranked after the top pairs"""
+        self.widget.triples = True
+        self.widget.top_k = 3
+        self.send_signal(self.widget.Inputs.data, self.zoo)
+        self.wait_until_finished()
+        self.process_events()
+        self.assertIsNotNone(self.widget.triple_states)
+        self.wait_until_finished()
+        self.process_events()
+        self.assertEqual(self.widget.button.text(), "Finished")
+        self.assertEqual(self.widget.model.columnCount(), 4)
+        n_rows = len(self.widget.triple_states)
+        self.assertGreater(n_rows, 16 - 2)
+        self.assertLessEqual(n_rows, 3 * (16 - 2))
+        self.assertEqual(self.widget.model.rowCount(), n_rows)
+
+        data = self.widget.model[:n_rows]
+        scorer = self.widget.scorer
+        npt.assert_almost_equal(
+            data[:, 0], scorer.normalize(scorer.score_triples(data[:, 1:])))
+        self.assertEqual(len(self.widget.selection), 3)
+
+    def test_resume_stage(self):
+        """Check that stages over lists of states resume at the offset"""
+        self.send_signal(self.widget.Inputs.data, self.zoo)
+        self.wait_until_finished()
+        states = [(1, 0, 2), (3, 0, 2), (4, 0, 2), (5, 0, 2)]
+        self.widget.triple_states = states
+        self.widget.progress = 2
+        self.widget.keep_running = True
+        with patch.object(self.widget, "start") as start:
+            self.widget.toggle()
+        iterate_states, saved_state = start.call_args[0][3:5]
+        self.assertEqual(list(iterate_states(saved_state)), states[2:])
+        self.assertEqual(list(iterate_states(0)), states)
+
+    def test_significance(self):
+        """Check that p-values are computed for the top pairs"""
+        self.widget.significance = True
+        self.widget.n_significant = 5
+        self.widget.n_permutations = 20
+        self.send_signal(self.widget.Inputs.data, self.zoo)
+        self.wait_until_finished()
+        self.process_events()
+        self.assertEqual(self.widget.button.text(), "Finished")
+        model = self.widget.model
+        self.assertEqual(model.columnCount(), 5)
+        self.assertEqual(model.headerData(2, Qt.Horizontal), "p-value")
+        n_rows = len(model)
+        data = model[:n_rows]
+        p_values = data[:, 2]
+        top = np.argsort(-data[:, 0], kind="stable")[:5]
+        self.assertTrue(np.all(p_values[top] > 0))
+        self.assertTrue(np.all(p_values[top] <= 1))
+        self.assertEqual(np.isnan(p_values).sum(), n_rows - 5)
+        npt.assert_almost_equal(
+            p_values[top],
+            self.widget.scorer.permutation_p_values(
+                data[top, -2:].astype(int), 20))
+
+    def test_per_target(self):
+        """Check that pairs are scored with each target of the class"""
+        domain = self.zoo.domain
+        legs = domain["legs"]
+        data = self.zoo.transform(Domain(
+            [var for var in domain.attributes if var is not legs],
+            [domain.class_var, legs]))
+        self.widget.per_target = True
+        self.send_signal(self.widget.Inputs.data, data)
+        self.wait_until_finished()
+        self.process_events()
+        model = self.widget.model
+        self.assertEqual(model.columnCount(), 6)
+        self.assertEqual(model.headerData(3, Qt.Horizontal), "Interaction (legs)")
+        n_rows = len(model)
+        self.assertEqual(n_rows, 15 * 14 // 2)
+
+        rows = model[:n_rows]
+        pairs = rows[:, -2:].astype(int)
+        for t, var in enumerate(data.domain.class_vars):
+            scorer = InteractionScorer(data.transform(
+                Domain(data.domain.attributes, var)))
+            npt.assert_almost_equal(rows[:, 2 + t],
+                                    scorer.normalize(scorer.score_pairs(pairs)))
+        npt.assert_almost_equal(
+            rows[:, 0], self.widget.scorer.normalized_scores(pairs)[:, 0])
+
+    def test_measures(self):
+        """Check that additional measures are kept and shown when chosen"""
+        self.widget.measures = [0, 2]
+        self.send_signal(self.widget.Inputs.data, self.zoo)
+        self.wait_until_finished()
+        self.process_events()
+        model, view = self.widget.model, self.widget.rank_table
+        self.assertEqual(model.columnCount(), 7)
+        self.assertEqual(
+            [model.headerData(column, Qt.Horizontal) for column in (2, 3, 4)],
+            ["Symmetric Uncertainty", "Conditional MI", "Chi-square"])
+        self.assertEqual([view.isColumnHidden(column) for column in range(7)],
+                         [False, False, False, True, False, False, False])
+        n_rows = len(model)
+        self.assertEqual(n_rows, 16 * 15 // 2)
+
+        rows = model[:n_rows]
+        pairs = rows[:, -2:].astype(int)
+        scorer = self.widget.scorer
+        npt.assert_almost_equal(rows[:, 0],
+                                scorer.normalized_scores(pairs)[:, 0])
+        npt.assert_almost_equal(
+            rows[:, 2:5], scorer.normalized_measures(
+                pairs, OWInteractions.EXTRA_MEASURES))
+
+        view.sortByColumn(4, Qt.DescendingOrder)
+        chi2 = [model.data(model.index(row, 4), Qt.EditRole)
+                for row in range(model.rowCount())]
+        self.assertEqual(chi2, sorted(chi2, reverse=True))
+
+        # choosing measures and modes does not score pairs again
+        with patch.object(InteractionScorer, "joint_entropies") as count, \
+                patch.object(InteractionScorer, "score_feature") as feature:
+            self.widget.measures = [1]
+            self.widget.on_measures_changed()
+            self.assertIsNone(self.widget.task)
+            self.assertEqual([view.isColumnHidden(column) for column in (2, 3, 4)],
+                             [True, False, True])
+            simulate.combobox_activate_index(
+                self.widget.controls.heuristic_mode, Heuristic.INFO_GAIN)
+            self.wait_until_finished()
+            self.widget.feature = self.widget.data.domain.attributes[3]
+            self.widget.on_feature_combo_changed()
+            self.wait_until_finished()
+            count.assert_not_called()
+            feature.assert_not_called()
+        rows = model[:len(model)]
+        self.assertEqual(len(rows), 15)
+        # stored measures are float32
+        npt.assert_allclose(
+            rows[:, 2:5], scorer.normalized_measures(
+                rows[:, -2:].astype(int), OWInteractions.EXTRA_MEASURES),
+            rtol=1e-6, atol=1e-6)
+
+    def test_matrix(self):
+        """Check the output matrix of interactions of all pairs"""
+        self.widget.heuristic_mode = Heuristic.TOP_K
+        self.widget.top_k = 5
+        self.send_signal(self.widget.Inputs.data, self.zoo)
+        self.wait_until_finished()
+        self.assertIsNone(self.get_output(self.widget.Outputs.matrix))
 
-    def test_row_for_state(self):
-        row = self.widget.row_for_state((-0.2, 0.2, 0.1), (1, 0))
-        self.assertListEqual(row, [-0.2, 0.1, 1, 0])
+        scorer = self.widget.scorer
+        with patch.object(scorer, "score_tile",
+                          wraps=scorer.score_tile) as score_tile:
+            self.widget.controls.output_matrix.click()
+            self.wait_until_finished()
+        # stored pairs are not scored again
+        n_scored = sum(np.count_nonzero(args[2]) for args, _ in
+                       score_tile.call_args_list)
+        self.assertEqual(n_scored, 16 * 15 - 2 * len(self.widget.model))
+        matrix = self.get_output(self.widget.Outputs.matrix)
+        self.assertEqual(matrix.shape, (16, 16))
+        self.assertEqual(matrix.dtype, np.float32)
+        self.assertEqual(matrix.get_labels(matrix.row_items)[0],
+                         self.zoo.domain.attributes[0].name)
+        npt.assert_equal(matrix, matrix.T)
+        npt.assert_equal(np.diag(matrix), 0)
+        # pruned pairs are scored too
+        rows = self.widget.model[:len(self.widget.model)]
+        pairs = rows[:, -2:].astype(int)
+        npt.assert_almost_equal(matrix[pairs[:, 0], pairs[:, 1]], rows[:, 0],
+                                decimal=6)
+        pairs = ScoreStore.pairs(np.arange(16 * 15 // 2))
+        scorer = self.widget.scorer
+        npt.assert_almost_equal(matrix[pairs[:, 0], pairs[:, 1]],
+                                scorer.normalized_scores(pairs)[:, 0],
+                                decimal=6)
+
+        self.widget.controls.output_matrix.click()
+        self.assertIsNone(self.get_output(self.widget.Outputs.matrix))
+        self.send_signal(self.widget.Inputs.data, None)
+        self.assertIsNone(self.get_output(self.widget.Outputs.matrix))
+
+    def test_append_rows_significance(self):
+        """Check that rows with p-values are ranked anew when rows are appended"""
+        with TemporaryDirectory() as cache_dir, \
+                patch.object(OWInteractions, "CACHE_DIR", cache_dir):
+            for use_cache in (False, True, True):
+                widget = self.create_widget(
+                    OWInteractions, stored_settings={"use_cache": use_cache})
+                widget.significance = True
+                widget.n_significant = 5
+                widget.n_permutations = 20
+                self.send_signal(widget.Inputs.data, self.zoo[:80],
+                                 widget=widget)
+                self.wait_until_finished(widget=widget)
+                self.assertEqual(widget.model.columnCount(), 5)
+                self.assertIsNotNone(widget.significance_states)
+
+                with patch.object(widget.scorer, "append") as append:
+                    self.send_signal(widget.Inputs.data, self.zoo,
+                                     widget=widget)
+                    append.assert_not_called()
+                self.wait_until_finished(widget=widget)
+                model = widget.model
+                self.assertEqual(model.columnCount(), 5)
+                self.assertEqual(len(model), 16 * 15 // 2)
+                self.assertEqual(
+                    np.sum(~np.isnan(model[:len(model), 2])), 5)
+
+    def test_append_rows(self):
+        """Check that scores are refreshed in place when rows are appended"""
+        self.send_signal(self.widget.Inputs.data, self.zoo[:80])
+        self.wait_until_finished()
+        scorer = self.widget.scorer
+        # counts are only kept if asked for
+        self.assertFalse(scorer.counts)
+        threads = {}
+
+        def record_thread(f):
+            def wrapped(*args):
+                threads[f.__name__] = threading.current_thread()
+                return f(*args)
+            return wrapped
+
+        with patch.object(self.widget, "compute_scores",
+                          record_thread(self.widget.compute_scores)), \
+                patch.object(scorer, "append", record_thread(scorer.append)):
+            self.send_signal(self.widget.Inputs.data, self.zoo)
+            self.assertFalse(self.widget.button.isEnabled())
+            self.wait_until_finished()
+        # rows are counted and scores refreshed in the background
+        self.assertEqual(set(threads), {"append", "compute_scores"})
+        self.assertNotIn(threading.main_thread(), threads.values())
+        self.assertIs(self.widget.scorer, scorer)
+        self.assertIsNone(self.widget.refreshing)
+        self.assertEqual(len(self.widget.data), len(self.zoo))
+        self.assertEqual(self.widget.button.text(), "Finished")
+        data = self.widget.model[:len(self.widget.model)]
+        self.assertEqual(len(data), 120)
+        expected = InteractionScorer(self.widget.data)
+        npt.assert_almost_equal(
+            data[:, 0],
+            expected.normalize(expected.score_pairs(data[:, -2:])))
+
+        # a different table is scored anew
+        self.send_signal(self.widget.Inputs.data, self.zoo[:50])
+        self.assertIsNot(self.widget.scorer, scorer)
+
+    def test_append_rows_anew(self):
+        """Check that rows the scorer cannot count are prepared anew"""
+        self.send_signal(self.widget.Inputs.data, self.zoo[:80])
+        self.wait_until_finished()
+        scorer = self.widget.scorer
+        with patch.object(scorer, "append", return_value=False):
+            self.send_signal(self.widget.Inputs.data, self.zoo)
+            self.wait_until_finished()
+        self.assertIsNot(self.widget.scorer, scorer)
+        self.assertEqual(len(self.widget.data), len(self.zoo))
+        self.assertEqual(len(self.widget.model), 120)
+        self.assertEqual(self.widget.button.text(), "Finished")
+
+    def test_append_rows_settings_changed(self):
+        """Check that settings changed while refreshing are used after"""
+        self.send_signal(self.widget.Inputs.data, self.zoo[:80])
+        self.wait_until_finished()
+        self.send_signal(self.widget.Inputs.data, self.zoo)
+        self.assertIsNotNone(self.widget.refreshing)
+        self.widget.feature = self.widget.data.domain.attributes[0]
+        self.widget.on_feature_combo_changed()
+        self.wait_until_finished()
+        self.assertEqual(len(self.widget.data), len(self.zoo))
+        self.assertEqual(len(self.widget.model), 15)
+        self.assertEqual(self.widget.button.text(), "Finished")
+
+    def test_keep_counts(self):
+        """Check that counts are kept for appended rows only if asked for"""
+        self.widget.keep_counts = True
+        self.send_signal(self.widget.Inputs.data, self.zoo[:80])
+        self.wait_until_finished()
+        scorer = self.widget.scorer
+        self.assertTrue(scorer.counts)
+        self.widget.controls.keep_counts.click()
+        self.assertFalse(self.widget.keep_counts)
+        self.assertFalse(scorer.keep_counts)
+        self.assertFalse(scorer.counts)
+        self.assertEqual(scorer.n_kept_cells, 0)
+
+    def test_cache(self):
+        """Check that results for the same data are loaded from the cache"""
+        with TemporaryDirectory() as cache_dir, \
+                patch.object(OWInteractions, "CACHE_DIR", cache_dir):
+            widget = self.create_widget(OWInteractions)
+            widget.heuristic_mode = Heuristic.TOP_K
+            widget.top_k = 3
+            self.send_signal(widget.Inputs.data, self.zoo, widget=widget)
+            self.wait_until_finished(widget=widget)
+            widget.cache.flush()
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            expected = widget.model[:len(widget.model)]
+            n_pruned = widget.n_pruned
+            # scores are stored as float32, pairs as indices
+            cached = widget.cache.get(widget.cache_key())
+            self.assertEqual(cached["scores"].dtype, np.float32)
+            self.assertEqual(cached["scores"].shape, (len(expected), 1))
+            self.assertEqual(cached["indices"].dtype, np.uint8)
+
+            widget = self.create_widget(OWInteractions)
+            widget.heuristic_mode = Heuristic.TOP_K
+            widget.top_k = 3
+            with patch.object(OWInteractions, "toggle") as toggle:
+                self.send_signal(widget.Inputs.data, self.zoo, widget=widget)
+                self.wait_until_finished(widget=widget)
+                toggle.assert_not_called()
+            npt.assert_almost_equal(widget.model[:len(widget.model)],
+                                    expected, decimal=6)
+            self.assertEqual(widget.button.text(), "Finished")
+            self.assertEqual(widget.n_pruned, n_pruned)
+
+            # other settings are not cached
+            widget.controls.top_k.setValue(4)
+            self.assertIsNotNone(widget.task)
+            self.wait_until_finished(widget=widget)
+            widget.cache.flush()
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+            # results just written are kept, unless larger than the limit
+            widget.cache.max_bytes = 2000
+            widget.controls.top_k.setValue(5)
+            self.wait_until_finished(widget=widget)
+            widget.cache.flush()
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            self.assertIsNotNone(widget.cache.get(widget.cache_key()))
+            widget.cache.max_bytes = 10
+            widget.controls.top_k.setValue(6)
+            self.wait_until_finished(widget=widget)
+            widget.cache.flush()
+            self.assertTrue(widget.Information.not_cached.is_shown())
+            self.assertIsNone(widget.cache.get(widget.cache_key()))
+
+            # least recently used results are removed
+            widget.cache.max_bytes = 1
+            widget.cache.evict()
+            self.assertEqual(len(os.listdir(cache_dir)), 0)
+
+    def test_checkpoint(self):
+        """Check that an unfinished run is resumed from its checkpoint"""
+        with TemporaryDirectory() as cache_dir, \
+                patch.object(OWInteractions, "CACHE_DIR", cache_dir):
+            widget = self.create_widget(OWInteractions)
+            self.send_signal(widget.Inputs.data, self.zoo, widget=widget)
+            self.wait_until_finished(widget=widget)
+            widget.cache.flush()
+            self.assertEqual(os.listdir(cache_dir), [widget.cache_key() + ".npz"])
+            expected = widget.model[:len(widget.model)]
+
+            # pretend the run stopped after the first 50 pairs
+            states = list(widget.heuristic.get_states(None))
+            scores = widget.store.get(states[:50])[0]
+            widget.store = ScoreStore(widget.n_attrs)
+            widget.store.put(states[:50], scores)
+            widget.saved_state = states[50]
+            widget.save_checkpoint()
+            widget.cache.remove(widget.cache_key())
+            # a bit per pair and scores of computed pairs
+            stored = widget.checkpoints.get(widget.checkpoint_key())
+            self.assertEqual(stored["computed"].nbytes, -(-120 // 8))
+            self.assertEqual(stored["scores"].dtype, np.float32)
+            self.assertEqual(len(stored["scores"]), 50)
+            # checkpoints are not evicted with results
+            widget.cache.max_bytes = 1
+            widget.cache.evict()
+            self.assertIsNotNone(
+                widget.checkpoints.get(widget.checkpoint_key()))
+            # checkpoints of other data are evicted, but not the current one
+            widget.checkpoints.put("other", scores=np.zeros(1000))
+            widget.checkpoints.flush()
+            path = widget.checkpoints.path("other")
+            os.utime(path, (0, 0))
+            widget.checkpoints.max_bytes = 3000
+            widget.save_checkpoint()
+            widget.checkpoints.flush()
+            self.assertFalse(os.path.exists(path))
+            self.assertIsNotNone(
+                widget.checkpoints.get(widget.checkpoint_key()))
+
+            widget = self.create_widget(OWInteractions)
+            with patch.object(OWInteractions, "toggle"):
+                self.send_signal(widget.Inputs.data, self.zoo, widget=widget)
+                self.wait_until_finished(widget=widget)
+            self.assertEqual(len(widget.model), 50)
+            self.assertEqual(widget.saved_state, states[50])
+            self.assertTrue(widget.Information.resumed.is_shown())
+
+            with patch.object(InteractionScorer, "normalized_scores",
+                              wraps=widget.scorer.normalized_scores) as score:
+                widget.toggle()
+                self.wait_until_finished(widget=widget)
+                self.assertEqual(sum(len(call[0][0])
+                                     for call in score.call_args_list), 70)
+            expected = {tuple(sorted(row[-2:])): row[0] for row in expected}
+            self.assertEqual(len(widget.model), 120)
+            for row in widget.model[:len(widget.model)]:
+                self.assertAlmostEqual(row[0], expected[tuple(sorted(row[-2:]))], 6)
+            widget.cache.flush()
+            self.assertEqual(
+                sorted(os.listdir(cache_dir)),
+                sorted([widget.cache_key() + ".npz", "checkpoints"]))
+            self.assertEqual(os.listdir(widget.checkpoints.directory), [])
+
+    def test_feature_scores(self):
+        """Check that pairs with the chosen feature are scored at once"""
+        self.send_signal(self.widget.Inputs.data, self.zoo)
+        self.wait_until_finished()
+        expected = {tuple(row[-2:]): row[0]
+                    for row in self.widget.model[:len(self.widget.model)]}
+        self.widget.store = ScoreStore(self.widget.n_attrs)
+        with patch.object(InteractionScorer, "score_feature",
+                          wraps=self.widget.scorer.score_feature) as score:
+            simulate.combobox_activate_index(self.widget.controls.feature, 3)
+            self.wait_until_finished()
+            score.assert_called_once()
+        self.assertEqual(len(self.widget.model), 15)
+        for row in self.widget.model[:len(self.widget.model)]:
+            self.assertAlmostEqual(
+                row[0], expected.get(tuple(row[-2:]),
+                                     expected.get(tuple(row[-1:-3:-1]))))
+
+    def test_score_store(self):
+        """Check that stored scores are reused when the mode changes"""
+        self.send_signal(self.widget.Inputs.data, self.zoo)
+        self.wait_until_finished()
+        expected = {tuple(sorted(row[-2:])): row[0]
+                    for row in self.widget.model[:len(self.widget.model)]}
+        self.assertEqual(len(self.widget.store), 120)
+
+        with patch.object(InteractionScorer, "normalized_scores") as scores:
+            simulate.combobox_activate_index(self.widget.controls.feature, 3)
+            self.wait_until_finished()
+            scores.assert_not_called()
+            self.assertEqual(len(self.widget.model), 15)
+            simulate.combobox_activate_index(
+                self.widget.controls.heuristic_mode, Heuristic.INFO_GAIN)
+            self.wait_until_finished()
+            scores.assert_not_called()
+        self.assertEqual(self.widget.button.text(), "Finished")
+        for row in self.widget.model[:len(self.widget.model)]:
+            self.assertAlmostEqual(row[0], expected[tuple(sorted(row[-2:]))], 6)
+            self.assertIn(self.widget.feature_index, row[-2:])
+
+    def test_on_disk(self):
+        """Check that discretized data can be kept on disk"""
+        self.send_signal(self.widget.Inputs.data, self.zoo)
+        self.wait_until_finished()
+        expected = self.widget.model[:len(self.widget.model)]
+        discretized = self.widget.preparation.data
+        with patch("orangecontrib.prototypes.widgets.owinteractions.EqualFreq") \
+                as method:
+            self.widget.controls.on_disk.setChecked(True)
+            self.wait_until_finished()
+            method.assert_not_called()
+        self.assertTrue(self.widget.scorer.on_disk)
+        self.assertIsInstance(self.widget.scorer.codes, np.memmap)
+        self.assertIs(self.widget.data.domain, discretized.domain)
+        npt.assert_almost_equal(
+            np.sort(self.widget.model[:len(self.widget.model)][:, 0]),
+            np.sort(expected[:, 0]))
+
+    def test_append_while_preparing(self):
+        """Check that rows appended while data are prepared are prepared too"""
+        self.send_signal(self.widget.Inputs.data, self.zoo[:80])
+        self.wait_until_finished()
+        self.widget.controls.on_disk.setChecked(True)
+        self.assertTrue(self.widget.preparing)
+        self.send_signal(self.widget.Inputs.data, self.zoo)
+        self.wait_until_finished()
+        self.assertFalse(self.widget.preparing)
+        self.assertIsInstance(self.widget.scorer.codes, np.memmap)
+        self.assertEqual(self.widget.scorer.n_rows, len(self.zoo))
+        self.assertEqual(len(self.widget.model), 16 * 15 // 2)
+
+        # settings are applied afterwards
+        simulate.combobox_activate_index(self.widget.controls.heuristic_mode,
+                                         Heuristic.TOP_K)
+        self.assertIsNotNone(self.widget.task)
+        self.wait_until_finished()
+
+    def test_run(self):
+        """Check that rows are sent in blocks, without a flush per chunk"""
+        task = Mock()
+        task.is_interruption_requested.return_value = False
+        states = [(i, j) for i in range(100) for j in range(i)]
+        stats = RunStats()
+        run(lambda chunk: np.ones((len(chunk), 3)),
+            OWInteractions.rows_for_states, lambda _: iter(states), None,
+            0, len(states), 10, None, None, task, stats=stats)
+        self.assertEqual(stats.n_scored, len(states))
+        self.assertGreater(stats.scoring, 0)
+        self.assertEqual(task.set_progress_value.call_count, 497)
+        blocks = [call[0][0][0] for call in task.set_partial_result.call_args_list]
+        self.assertLess(len(blocks), 50)
+        rows = np.vstack([block for block in blocks if len(block)])
+        npt.assert_equal(rows, np.column_stack((np.ones(len(states)),
+                                                np.full(len(states), 3),
+                                                states)))
+
+    def test_rows_for_states(self):
+        rows = self.widget.rows_for_states(
+            [(-0.2, 0.2, 0.1), (0.3, 0.1, 0.2)], [(1, 0), (2, 1)])
+        npt.assert_almost_equal(rows, [[-0.2, 0.1, 1, 0], [0.3, 0.6, 2, 1]])
 
     def test_iterate_states(self):
         self.send_signal(self.widget.Inputs.data, self.iris)
+        self.wait_until_finished()
         self.assertListEqual(list(self.widget._iterate_all(None)),
                              [(1, 0), (2, 0), (2, 1), (3, 0), (3, 1), (3, 2)])
         self.assertListEqual(list(self.widget._iterate_all((1, 0))),
@@ -225,6 +989,7 @@ class TestOWInteractions(WidgetTest):
 
     def test_state_count(self):
         self.send_signal(self.widget.Inputs.data, self.iris)
+        self.wait_until_finished()
         self.assertEqual(self.widget.state_count(), 6)
         self.widget.feature_index = 2
         self.assertEqual(self.widget.state_count(), 3)
@@ -255,6 +1020,347 @@ class TestInteractionScorer(unittest.TestCase):
         npt.assert_almost_equal(self.scorer.information_gain[0], 0.4343, 4)
         npt.assert_almost_equal(self.scorer.information_gain[1], 0.0343, 4)
 
+    def test_backends(self):
+        """Check that counting and sorting give the same scores"""
+        data = Table("zoo").copy()
+        with data.unlocked():
+            data.X[::7, 3] = np.nan
+            data.Y[::11] = np.nan
+        unique = InteractionScorer(data, InteractionScorer.UNIQUE)
+        bincount = InteractionScorer(data, InteractionScorer.BINCOUNT)
+        npt.assert_almost_equal(unique.class_entropy, bincount.class_entropy)
+        npt.assert_almost_equal(unique.information_gain,
+                                bincount.information_gain)
+        for attr1, attr2 in ((1, 0), (3, 2), (5, 3), (15, 14)):
+            npt.assert_almost_equal(unique(attr1, attr2),
+                                    bincount(attr1, attr2))
+
+        # methods that need codes say so
+        for method, arg in ((unique.score_triples, [[0, 1, 2]]),
+                            (unique.score_targets, [[0, 1]]),
+                            (partial(unique.score_measures,
+                                     measures=[Measure.CHI_SQUARE]), [[0, 1]]),
+                            (unique.permutation_p_values, [[0, 1]])):
+            self.assertRaisesRegex(ValueError, "encoded data", method, arg)
+
+    def test_score_pairs(self):
+        """Check batched score calculation"""
+        data = Table("zoo").copy()
+        with data.unlocked():
+            data.X[::5, 2] = np.nan
+        scorer = InteractionScorer(data)
+        pairs = np.array([(i, j) for i in range(4) for j in range(i)])
+        expected = [InteractionScorer(data, InteractionScorer.UNIQUE)(i, j)
+                    for i, j in pairs]
+        npt.assert_almost_equal(scorer.score_pairs(pairs), expected)
+        scorer.MAX_KEYS = 2 * len(data)
+        self.assertEqual(scorer.block_size, 2)
+        npt.assert_almost_equal(scorer.score_pairs(pairs), expected)
+        self.assertEqual(scorer.score_pairs(np.empty((0, 2))).shape, (0,))
+
+    def test_on_disk(self):
+        """Check that memory-mapped codes counted in chunks give the same scores"""
+        data = Table("zoo").copy()
+        with data.unlocked():
+            data.X[::5, 2] = np.nan
+        scorer = InteractionScorer(data)
+        on_disk = InteractionScorer(data, on_disk=True)
+        self.assertIsInstance(on_disk.codes, np.memmap)
+        pairs = np.array([(i, j) for i in range(4) for j in range(i)])
+        triples = np.array([(0, 1, 2), (2, 3, 5)])
+        with patch.object(InteractionScorer, "CHUNK_ROWS", 7):
+            chunked = InteractionScorer(data, on_disk=True)
+            npt.assert_almost_equal(chunked.information_gain,
+                                    scorer.information_gain)
+            npt.assert_almost_equal(chunked.score_pairs(pairs),
+                                    scorer.score_pairs(pairs))
+            npt.assert_almost_equal(chunked.score_triples(triples),
+                                    scorer.score_triples(triples))
+
+        codes = np.memmap(TemporaryFile(), dtype=scorer.codes.dtype,
+                          mode="w+", shape=scorer.codes.shape, order="F")
+        codes[:] = scorer.codes
+        mapped = InteractionScorer.from_codes(
+            codes, scorer.cardinalities, scorer.class_codes,
+            scorer.class_cardinality)
+        npt.assert_almost_equal(mapped.score_pairs(pairs),
+                                scorer.score_pairs(pairs))
+
+    def test_packed(self):
+        """Check that counting on bit vectors gives the same scores"""
+        rng = np.random.default_rng(0)
+        x = rng.integers(0, 3, (500, 6)).astype(float)
+        x[:, :3] = x[:, :3] > 0
+        x[rng.random(x.shape) < 0.05] = np.nan
+        y = rng.integers(0, 2, 500).astype(float)
+        y[rng.random(500) < 0.05] = np.nan
+        x[:, 5] = rng.integers(0, 5, 500)
+        pairs = np.array(list(combinations(range(6), 2)))
+        triples = np.array(list(combinations(range(6), 3)))
+
+        with patch.object(InteractionScorer, "MIN_PACKED_ROWS", 1 << 30):
+            scorer = InteractionScorer.from_arrays(x[:400], y[:400])
+            self.assertFalse(scorer.packable(pairs).any())
+            expected = scorer.score_pairs(pairs), scorer.score_triples(triples)
+        scorer = InteractionScorer.from_arrays(x[:400], y[:400])
+        npt.assert_equal(scorer.packable(pairs), pairs[:, 1] != 5)
+        with patch.object(InteractionScorer, "_count_block",
+                          wraps=scorer._count_block) as count:
+            npt.assert_almost_equal(scorer.score_pairs(pairs), expected[0])
+            self.assertEqual(sum(len(call[0][0]) for call in count.call_args_list),
+                             5)
+        npt.assert_almost_equal(scorer.score_triples(triples), expected[1])
+
+        # counts kept from bit vectors are updated by appended rows
+        scorer = InteractionScorer.from_arrays(x[:400], y[:400])
+        scorer.keep_counts = True
+        scorer.score_pairs(pairs)
+        self.assertTrue(scorer.append(x[400:], y[400:]))
+        expected = InteractionScorer.from_arrays(x, y)
+        npt.assert_almost_equal(scorer.score_pairs(pairs),
+                                expected.score_pairs(pairs))
+
+    def test_append(self):
+        """Check that appended rows update kept counts and scores"""
+        data = Table("zoo")
+        pairs = np.array([(i, j) for i in range(5) for j in range(i)])
+        scorer = InteractionScorer(data[:80])
+        scorer.keep_counts = True
+        scorer.score_pairs(pairs[:6])
+        self.assertEqual(len(scorer.counts), 6)
+        with patch.object(InteractionScorer, "CHUNK_ROWS", 7):
+            self.assertTrue(scorer.append(data.X[80:], data.Y[80:]))
+        expected = InteractionScorer(data)
+        self.assertEqual(scorer.n_rows, len(data))
+        npt.assert_almost_equal(scorer.information_gain,
+                                expected.information_gain)
+        with patch.object(InteractionScorer, "_count_block") as count:
+            scores = scorer.score_pairs(pairs[:6])
+            count.assert_not_called()
+        npt.assert_almost_equal(scores, expected.score_pairs(pairs[:6]))
+        npt.assert_almost_equal(scorer.score_pairs(pairs),
+                                expected.score_pairs(pairs))
+
+        x = data.X[:1].copy()
+        x[0, 0] = 5
+        self.assertFalse(scorer.append(x, data.Y[:1]))
+        self.assertEqual(scorer.n_rows, len(data))
+
+        # scorers with given information gains count attributes when needed
+        first = InteractionScorer(data[:80])
+        scorer = InteractionScorer.from_codes(
+            first.codes, first.cardinalities, first.class_codes,
+            first.class_cardinality, first.class_entropy,
+            first.information_gain, first.entropies)
+        self.assertTrue(scorer.append(data.X[80:], data.Y[80:]))
+        npt.assert_almost_equal(scorer.information_gain,
+                                expected.information_gain)
+        npt.assert_almost_equal(first.information_gain,
+                                InteractionScorer(data[:80]).information_gain)
+        npt.assert_almost_equal(scorer.score_pairs(pairs),
+                                expected.score_pairs(pairs))
+
+    def test_score_feature(self):
+        """Check interactions of a feature with all others in one pass"""
+        data = Table("zoo").copy()
+        with data.unlocked():
+            data.X[::5, 2] = np.nan
+        scorer = InteractionScorer(data)
+        others = [j for j in range(16) if j != 2]
+        expected = scorer.score_pairs([(2, j) for j in others])
+        npt.assert_almost_equal(scorer.score_feature(2), expected)
+        npt.assert_almost_equal(scorer.score_feature(2, others[::-1]),
+                                expected[::-1])
+        scorer.MAX_KEYS, scorer.CHUNK_ROWS = 100, 20
+        npt.assert_almost_equal(scorer.score_feature(2), expected)
+
+    def test_codes(self):
+        """Check that data is stored as compact integer codes"""
+        x = np.array([[0, 2], [1, np.nan], [300, 1], [1, 0]])
+        y = np.array([0, 1, np.nan, 1])
+        domain = Domain([DiscreteVariable(str(i)) for i in range(2)], DiscreteVariable("3"))
+        scorer = InteractionScorer(Table(domain, x, y))
+        self.assertEqual(scorer.codes.dtype, np.uint16)
+        self.assertEqual(scorer.class_codes.dtype, np.uint8)
+        self.assertTrue(scorer.codes.flags.f_contiguous)
+        npt.assert_equal(scorer.cardinalities, [301, 3])
+        self.assertEqual(scorer.class_cardinality, 2)
+        npt.assert_equal(scorer.codes[:, 1], [2, 3, 1, 0])
+        npt.assert_equal(scorer.class_codes, [0, 1, 2, 1])
+
+    def test_hash_rows(self):
+        """Check that row ids do not collide for many bins"""
+        ar = np.array([[10000, 0], [0, 1], [0, 1]], dtype=float)
+        npt.assert_almost_equal(np.sort(distribution(ar)), [1 / 3, 2 / 3])
+        self.assertEqual(len(set(hash_rows(ar))), 2)
+
+    def test_sample_scorer(self):
+        """Check approximate scores and their intervals"""
+        data = Table("zoo")
+        scorer = InteractionScorer(data)
+        pairs = np.array([(1, 0), (5, 3), (12, 7)])
+        scores, half_widths = SampleScorer(scorer, len(data)).score_pairs(pairs)
+        npt.assert_almost_equal(scores, scorer.score_pairs(pairs))
+        self.assertTrue(np.all(half_widths > 0))
+
+        sample = SampleScorer(scorer, 40)
+        self.assertEqual(sample.sample.n_rows, 40)
+        self.assertEqual(sum(split.n_rows for split in sample.splits), 40)
+        self.assertEqual(len(sample.score_pairs(pairs)[0]), 3)
+
+    def test_permutation_p_values(self):
+        """Check that interacting pairs are significant and noise is not"""
+        rng = np.random.default_rng(0)
+        x = rng.integers(0, 2, (300, 6)).astype(float)
+        y = np.logical_xor(x[:, 0], x[:, 1]).astype(float)
+        flip = rng.random(300) < 0.1
+        y[flip] = 1 - y[flip]
+        scorer = InteractionScorer.from_arrays(x, y)
+        pairs = np.array(list(combinations(range(6), 2)))
+        p_values = scorer.permutation_p_values(pairs, 100)
+        self.assertEqual(p_values.shape, (len(pairs), ))
+        self.assertLess(p_values[0], 0.05)
+        self.assertGreater(np.median(p_values[1:]), 0.05)
+        self.assertTrue(np.all((p_values > 0) & (p_values <= 1)))
+        npt.assert_equal(p_values, scorer.permutation_p_values(pairs, 100))
+
+        # permutations are compact and shared by chunks of pairs
+        classes = scorer.permuted_classes(100)
+        self.assertEqual(classes.shape, (300, 101))
+        self.assertEqual(classes.dtype, np.uint8)
+        npt.assert_equal(classes[:, 0], scorer.class_codes)
+        self.assertIs(scorer.permuted_classes(100), classes)
+        npt.assert_equal(
+            np.concatenate([scorer.permutation_p_values(pairs[:5], 100),
+                            scorer.permutation_p_values(pairs[5:], 100)]),
+            p_values)
+        self.assertIs(scorer.permuted_classes(100), classes)
+
+    def test_score_targets(self):
+        """Check that scores of targets equal scores of separate scorers"""
+        rng = np.random.default_rng(0)
+        x = rng.integers(0, 3, (300, 5)).astype(float)
+        x[rng.random(x.shape) < 0.05] = np.nan
+        y = rng.integers(0, 3, (300, 2)).astype(float)
+        y[rng.random(y.shape) < 0.05] = np.nan
+        pairs = np.array(list(combinations(range(5), 2)))
+
+        scorer = InteractionScorer.from_arrays(x, y)
+        scores = scorer.score_targets(pairs)
+        self.assertEqual(scores.shape, (len(pairs), 3))
+        npt.assert_almost_equal(scores[:, 0], scorer.score_pairs(pairs))
+        for t in range(2):
+            target = InteractionScorer.from_arrays(x, y[:, t])
+            npt.assert_almost_equal(scores[:, t + 1], target.score_pairs(pairs))
+            npt.assert_almost_equal(scorer.target_gains()[1][t],
+                                    target.information_gain)
+
+        # rows and pairs are counted in chunks
+        scorer.CHUNK_ROWS, scorer.MAX_KEYS = 64, 256
+        npt.assert_almost_equal(scorer.score_targets(pairs), scores)
+        self.assertTrue(scorer.append(x[:10], y[:10]))
+        expected = InteractionScorer.from_arrays(np.vstack((x, x[:10])),
+                                                 np.vstack((y, y[:10])))
+        npt.assert_almost_equal(scorer.score_targets(pairs),
+                                expected.score_targets(pairs))
+
+    def test_score_measures(self):
+        """Check measures derived from joint counts of pairs"""
+        rng = np.random.default_rng(0)
+        x = rng.integers(0, 3, (300, 4)).astype(float)
+        y = rng.integers(0, 2, 300).astype(float)
+        pairs = np.array(list(combinations(range(4), 2)))
+        scorer = InteractionScorer.from_arrays(x, y)
+        scores = scorer.score_measures(pairs, list(Measure.name))
+        npt.assert_almost_equal(scores[:, 0], scorer.score_pairs(pairs))
+
+        for (a, b), (_, su, cmi, chi2) in zip(pairs, scores):
+            xa, xb, xy = x[:, a], x[:, b], y
+            h_y = entropy(xy)
+            h_ab, h_aby = entropy(np.column_stack((xa, xb))), \
+                entropy(np.column_stack((xa, xb, xy)))
+            self.assertAlmostEqual(su, 2 * (h_ab + h_y - h_aby) / (h_ab + h_y))
+            self.assertAlmostEqual(
+                cmi, entropy(np.column_stack((xa, xy)))
+                + entropy(np.column_stack((xb, xy))) - h_aby - h_y)
+            table = np.zeros((9, 2))
+            np.add.at(table, ((3 * xa + xb).astype(int), xy.astype(int)), 1)
+            table = table[table.sum(axis=1) > 0]
+            expected = np.outer(table.sum(axis=1), table.sum(axis=0)) \
+                / table.sum()
+            self.assertAlmostEqual(
+                chi2, np.sum((table - expected) ** 2 / expected))
+
+    def test_interaction_matrix(self):
+        """Check that tiles of the matrix give the scores of pairs"""
+        rng = np.random.default_rng(0)
+        x = rng.integers(0, 4, (200, 7)).astype(float)
+        x[rng.random(x.shape) < 0.05] = np.nan
+        y = rng.integers(0, 2, 200).astype(float)
+        scorer = InteractionScorer.from_arrays(x, y)
+        pairs = ScoreStore.pairs(np.arange(7 * 6 // 2))
+        scores = scorer.score_pairs(pairs)
+
+        npt.assert_almost_equal(scorer.score_tile([2, 3], [0, 5, 6]),
+                                scorer.score_pairs(
+                                    [(2, 0), (2, 5), (2, 6),
+                                     (3, 0), (3, 5), (3, 6)]).reshape(2, 3))
+        # pairs of diagonal tiles are counted once; masked pairs are zero
+        with patch.object(scorer, "_count_tile",
+                          wraps=scorer._count_tile) as count_tile:
+            tile = scorer.score_tile([1, 2, 3], [1, 2, 3])
+            self.assertEqual(len(count_tile.call_args[0][2]), 3)
+            mask = np.ones((3, 3), dtype=bool)
+            mask[0, 2] = mask[2, 0] = False
+            masked = scorer.score_tile([1, 2, 3], [1, 2, 3], mask)
+            self.assertEqual(len(count_tile.call_args[0][2]), 2)
+        npt.assert_almost_equal(tile[[0, 0, 1], [1, 2, 2]],
+                                scorer.score_pairs([(1, 2), (1, 3), (2, 3)]))
+        npt.assert_equal(tile, tile.T)
+        npt.assert_equal(np.diag(tile), 0)
+        npt.assert_equal(masked[mask], tile[mask])
+        npt.assert_equal(masked[~mask], 0)
+        progress = Mock()
+        matrix = interaction_matrix(scorer, tile_size=3, progress=progress)
+        self.assertEqual(matrix.dtype, np.float32)
+        npt.assert_almost_equal(matrix[pairs[:, 0], pairs[:, 1]], scores,
+                                decimal=6)
+        npt.assert_equal(matrix, matrix.T)
+        npt.assert_equal(np.diag(matrix), 0)
+        self.assertEqual(progress.call_args_list[-1][0], (6, 6))
+
+        with TemporaryFile() as f:
+            out = np.memmap(f, dtype=np.float32, mode="w+", shape=(7, 7))
+            self.assertIs(interaction_matrix(scorer, out, normalize=True), out)
+            npt.assert_almost_equal(out, scorer.normalize(matrix), decimal=6)
+
+        # attributes with few values are counted on bit vectors
+        x = rng.integers(0, 2, (300, 5)).astype(float)
+        y = rng.integers(0, 2, 300).astype(float)
+        scorer = InteractionScorer.from_arrays(x, y)
+        with patch.object(scorer, "_count_tile") as count_tile:
+            tile = scorer.score_tile([0, 1], [2, 3, 4])
+            count_tile.assert_not_called()
+        npt.assert_almost_equal(
+            tile, scorer.score_pairs([(0, 2), (0, 3), (0, 4),
+                                      (1, 2), (1, 3), (1, 4)]).reshape(2, 3))
+
+    def test_score_triples(self):
+        """Check three-way interactions against entropies of all subsets"""
+        data = Table("zoo")
+        scorer = InteractionScorer(data)
+        triples = np.array([(0, 1, 2), (3, 5, 12), (2, 7, 14)])
+        for triple, score in zip(triples, scorer.score_triples(triples)):
+            columns = [data.X[:, attr] for attr in triple] + [data.Y]
+            expected = sum((-1) ** (len(subset) + 1)
+                           * entropy(np.column_stack(subset))
+                           for n in range(1, 5)
+                           for subset in combinations(columns, n))
+            npt.assert_almost_equal(score, expected)
+        self.assertEqual(len(scorer.pair_cache), 9)
+        npt.assert_almost_equal(scorer.score_triples(triples[::-1]),
+                                scorer.score_triples(triples)[::-1])
+
 
 class TestHeuristic(unittest.TestCase):
     @classmethod
@@ -276,6 +1382,143 @@ class TestHeuristic(unittest.TestCase):
                              [(14, 10), (14, 15), (6, 10), (14, 5),
                               (6, 15), (14, 11), (6, 5), (10, 15)])
 
+    def test_seek(self):
+        """Check that states are found by index without replaying"""
+        for n in (3, 4, 17):
+            heuristic = Heuristic(np.random.random(n), Heuristic.INFO_GAIN)
+            states = list(heuristic.generate_states())
+            self.assertEqual(len(set(map(frozenset, states))), n * (n - 1) // 2)
+            npt.assert_equal(heuristic.index(states), np.arange(len(states)))
+            npt.assert_equal(heuristic.states_at(np.arange(len(states))), states)
+            self.assertListEqual(list(heuristic.get_states(states[2])),
+                                 states[2:])
+        with patch.object(heuristic, "_generate_by_sum") as generate:
+            list(heuristic.get_states(states[100]))
+            generate.assert_not_called()
+        heuristic = Heuristic(np.random.random(5), Heuristic.TOP_K)
+        states = list(heuristic.generate_states())
+        self.assertListEqual(list(heuristic.get_states(states[4])), states[4:])
+        self.assertRaises(ValueError, heuristic.index, states[:1])
+
+    def test_bipartite(self):
+        """Check that only pairs of a left and a right attribute are visited"""
+        weights = np.random.random(9)
+        left = [2, 5, 7]
+        for mode in Heuristic.mode:
+            heuristic = Heuristic(weights, mode, left=left)
+            states = list(heuristic.generate_states())
+            self.assertEqual(heuristic.n_states, 18)
+            self.assertEqual(len(set(states)), 18)
+            for a, b in states:
+                self.assertIn(a, left)
+                self.assertNotIn(b, left)
+            self.assertListEqual(list(heuristic.get_states(states[5])),
+                                 states[5:])
+            if mode == Heuristic.TOP_K:
+                sums = weights[np.array(states)].sum(axis=1)
+                npt.assert_equal(sums, np.sort(sums))
+            else:
+                npt.assert_equal(heuristic.index(states), np.arange(18))
+                npt.assert_equal(heuristic.index(np.fliplr(states)),
+                                 np.arange(18))
+                npt.assert_equal(heuristic.states_at(np.arange(18)), states)
+
+    def test_top_k_order(self):
+        """Check that pairs are ordered by decreasing upper bound"""
+        weights = np.array([0.3, 0.1, 0.5, 0.2, 0.05])
+        heuristic = Heuristic(weights, Heuristic.TOP_K)
+        states = list(heuristic.get_states(None))
+        self.assertEqual(len(states), 10)
+        self.assertEqual({frozenset(st) for st in states},
+                         {frozenset((i, j)) for i in range(5) for j in range(i)})
+        sums = [weights[i] + weights[j] for i, j in states]
+        self.assertListEqual(sums, sorted(sums))
+
+class TestTopK(unittest.TestCase):
+    def test_trim(self):
+        top_k = TopK(2, lambda states: 1 - np.asarray(states).sum(axis=1),
+                     [0.1, 0.5, 0.3])
+        self.assertEqual(top_k.threshold, 0.3)
+        states = [(0, 0.1), (0.2, 0.3), (0.5, 0.5)]
+        self.assertListEqual(top_k.trim(states), states[:2])
+        top_k.add([0.9])
+        self.assertEqual(top_k.threshold, 0.5)
+        self.assertListEqual(top_k.trim(states), states[:1])
+        self.assertEqual(TopK(3, None).threshold, -np.inf)
+
+
+class TestRankInteractions(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.zoo = Table("zoo")
+        cls.names = [attr.name for attr in cls.zoo.domain.attributes]
+        cls.scorer = InteractionScorer(cls.zoo)
+
+    def test_csv(self):
+        """Check that all pairs are written to csv"""
+        with TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "pairs.csv")
+            progress = Mock()
+            rank_interactions(self.scorer, self.names, output,
+                              progress=progress)
+            with open(output) as f:
+                rows = list(csv.reader(f))
+        self.assertEqual(len(rows), 121)
+        self.assertEqual(rows[0][0], "interaction")
+        progress.assert_called_with(120, 120)
+        pairs = np.array([(self.names.index(row[3]), self.names.index(row[4]))
+                          for row in rows[1:]])
+        npt.assert_almost_equal(
+            [float(row[0]) for row in rows[1:]],
+            self.scorer.normalize(self.scorer.score_pairs(pairs)))
+
+    def test_npz(self):
+        """Check that all pairs are written to npz, in order of scoring"""
+        with TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "pairs.npz")
+            rank_interactions(self.scorer, self.names, output)
+            with np.load(output) as result:
+                scores, pairs = result["scores"], result["pairs"]
+                self.assertEqual(result["names"].tolist(), self.names)
+        self.assertEqual(scores.shape, (120, 3))
+        self.assertEqual(pairs.dtype, np.int64)
+        npt.assert_equal(pairs, [(i, j) for i in range(16) for j in range(i)])
+        npt.assert_almost_equal(
+            scores, self.scorer.normalized_scores(pairs))
+
+    def test_top_k(self):
+        """Check that top pairs are the same with pruning and with threads"""
+        scores = self.scorer.normalize(self.scorer.score_pairs(
+            [(i, j) for i in range(16) for j in range(i)]))
+        with TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "pairs.npz")
+            rank_interactions(self.scorer, self.names, output, top_k=5,
+                              n_workers=2, threads=True)
+            with np.load(output) as result:
+                npt.assert_almost_equal(result["scores"][:, 0],
+                                        np.sort(scores)[::-1][:5])
+                npt.assert_almost_equal(
+                    result["scores"][:, 0],
+                    self.scorer.normalize(
+                        self.scorer.score_pairs(result["pairs"])))
+
+    def test_main(self):
+        """Check that the command line does not need Qt for npz data"""
+        with TemporaryDirectory() as tmp:
+            data = os.path.join(tmp, "zoo.npz")
+            output = os.path.join(tmp, "pairs.csv")
+            np.savez(data, X=self.zoo.X, Y=self.zoo.Y, names=self.names)
+            code = "import sys; " \
+                   "from orangecontrib.prototypes.interactions import main; " \
+                   f"main([{data!r}, {output!r}, '--top-k', '3']); " \
+                   "assert 'AnyQt' not in sys.modules"
+            process = subprocess.run([sys.executable, "-c", code],
+                                     capture_output=True, text=True)
+            self.assertEqual(process.returncode, 0, process.stderr)
+            self.assertIn("pairs", process.stderr)
+            with open(output) as f:
+                self.assertEqual(len(f.readlines()), 4)
+
 
 if __name__ == "__main__":
     unittest.main()